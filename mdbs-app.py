@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objs as go
 from plotly.subplots import make_subplots
@@ -10,7 +11,44 @@ import folium
 from streamlit_folium import st_folium
 from folium.plugins import MarkerCluster
 import random
-from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import mdbs_exportacion as exp
+import mdbs_modelos as ml
+from mdbs_api import iniciar_api_agregados
+from mdbs_datos import (
+    FACETA_TODAS,
+    FRECUENCIAS,
+    PAISES_5FP,
+    agregar_flujos_por_fechas,
+    agregar_flujos_por_sectores,
+    calcular_correlaciones,
+    calcular_yoy_flujos,
+    combinar_facetas,
+    construir_facetas,
+    extremos_anios,
+    extremos_montos,
+    filtrar_anios,
+    dataset_version,
+    filtrar_flujos_agregados,
+    filtrar_montos,
+    filtrar_paises,
+    formato_faceta,
+    get_flujos_base,
+    get_pyg_renderer_by_name,
+    iniciar_servicios,
+    load_dataframes,
+    opciones_faceta,
+    registrar_uso,
+    sincronizar_caches,
+)
 
 # -----------------------------------------------------------------------------
 # CONFIGURACION DE PAGINA Y CSS (MODO OSCURO)
@@ -54,30 +92,11 @@ st.markdown(
 )
 
 # -----------------------------------------------------------------------------
-# 1) CARGA DE DATOS (CACHE)
+# 1) CARGA DE DATOS (CACHE, VER mdbs_datos.py)
 # -----------------------------------------------------------------------------
-@st.cache_data
-def load_dataframes():
-    df_activity = pd.read_parquet("activity_iadb.parquet")
-    df_outgoing = pd.read_parquet("outgoing_commitment_iadb.parquet")
-    df_disb = pd.read_parquet("disbursements_data.parquet")
-
-    return {
-        "ACTIVITY_IADB": df_activity,
-        "OUTGOING_COMMITMENT_IADB": df_outgoing,
-        "DISBURSEMENTS_DATA": df_disb
-    }
-
-DATASETS = load_dataframes()
-
-# -----------------------------------------------------------------------------
-# 2) CREACION DEL RENDERER DE PYGWALKER (CACHE)
-# -----------------------------------------------------------------------------
-@st.cache_resource
-def get_pyg_renderer_by_name(dataset_name: str):
-    from pygwalker.api.streamlit import StreamlitRenderer
-    df = DATASETS[dataset_name]
-    return StreamlitRenderer(df, kernel_computation=True)
+DATASET_VERSION = dataset_version()
+sincronizar_caches(DATASET_VERSION)
+DATASETS = load_dataframes(DATASET_VERSION)
 
 # -----------------------------------------------------------------------------
 # FUNCIONES AUXILIARES
@@ -105,7 +124,7 @@ def boxplot_modalidad(df: pd.DataFrame, titulo_extra: str = ""):
                 paper_bgcolor="rgba(0,0,0,0)",
                 plot_bgcolor="rgba(0,0,0,0)"
             )
-            st.plotly_chart(fig1, use_container_width=True)
+            mostrar_grafico(fig1, "ejecucion_box_duracion")
 
     if needed_cols_2.issubset(df.columns):
         df2 = df[df["modalidad_general"].notna() & df["completion_delay_years"].notna()]
@@ -126,30 +145,292 @@ def boxplot_modalidad(df: pd.DataFrame, titulo_extra: str = ""):
                 paper_bgcolor="rgba(0,0,0,0)",
                 plot_bgcolor="rgba(0,0,0,0)"
             )
-            st.plotly_chart(fig2, use_container_width=True)
+            mostrar_grafico(fig2, "ejecucion_box_atraso")
 
 
-def compute_yoy(df: pd.DataFrame, date_col: str, value_col: str, freq_code: str, shift_periods: int):
-    df_resampled = df.copy()
-    df_resampled.set_index(date_col, inplace=True)
+# -----------------------------------------------------------------------------
+# GRAFICOS: PRESUPUESTO DE PAYLOAD Y ARRAYS COMPACTOS
+# -----------------------------------------------------------------------------
+# Con plotly>=6 los arrays numpy numericos viajan al navegador como typed arrays
+# en base64 ({"dtype": "f8", "bdata": ...}) en vez de listas JSON de numeros.
+# Los floats conservan su precision (montos USD pueden llegar a 1e10); solo se
+# usa float32 donde el grafico lo decide explicitamente (p.ej. porcentajes).
+FIG_PAYLOAD_BUDGET_KB = float(os.environ.get("MDBS_FIG_BUDGET_KB", "250"))
+# Medir exige serializar la figura una vez mas (st.plotly_chart la serializa
+# por su cuenta): solo se mide la primera vez y luego 1 de cada N renders.
+FIG_PAYLOAD_MUESTREO = max(1, int(os.environ.get("MDBS_FIG_MUESTREO", "20")))
+ATRIBUTOS_NUMERICOS = ("x", "y", "z", "customdata")
+
+logger = logging.getLogger("mdbs")
 
-    df_agg = df_resampled[value_col].resample(freq_code).sum().reset_index()
-    df_agg = df_agg.sort_values(date_col)
-    df_agg["yoy"] = df_agg[value_col].pct_change(periods=shift_periods) * 100
 
-    if freq_code.upper() == "A":  
-        df_agg["Periodo"] = df_agg[date_col].dt.year.astype(str)
-    elif freq_code.upper() in ["Q", "3M"]:  
-        df_agg["Periodo"] = (
-            df_agg[date_col].dt.year.astype(str) + "T" + df_agg[date_col].dt.quarter.astype(str)
+@st.cache_resource
+def get_registro_payloads():
+    # nombre de grafico -> {"renders", "n", "ultimo", "maximo", "excesos"}
+    # (n = renders medidos; tamaños en bytes)
+    return {"lock": threading.Lock(), "graficos": {}}
+
+
+def _array_compacto(valores):
+    if valores is None or isinstance(valores, (str, dict)):
+        return None
+    arr = np.asarray(valores)
+    if arr.dtype.kind == "f":
+        return arr
+    if arr.dtype.kind in "iu" and arr.size and np.abs(arr).max() < 2**31:
+        return arr.astype(np.int32)
+    return None
+
+
+def compactar_figura(fig: go.Figure) -> go.Figure:
+    for trace in fig.data:
+        for attr in ATRIBUTOS_NUMERICOS:
+            if attr not in trace:
+                continue
+            compacto = _array_compacto(trace[attr])
+            if compacto is not None:
+                trace[attr] = compacto
+    return fig
+
+
+def medir_payload(nombre: str) -> bool:
+    registro = get_registro_payloads()
+    with registro["lock"]:
+        stats = registro["graficos"].setdefault(
+            nombre, {"renders": 0, "n": 0, "ultimo": 0, "maximo": 0, "excesos": 0}
         )
-    elif freq_code.upper() in ["6M", "2Q"]:  
-        sm = (df_agg[date_col].dt.month.sub(1)//6).add(1)
-        df_agg["Periodo"] = df_agg[date_col].dt.year.astype(str) + "S" + sm.astype(str)
+        stats["renders"] += 1
+        return (stats["renders"] - 1) % FIG_PAYLOAD_MUESTREO == 0
+
+
+def registrar_payload(nombre: str, payload: int):
+    registro = get_registro_payloads()
+    with registro["lock"]:
+        stats = registro["graficos"][nombre]
+        stats["n"] += 1
+        stats["ultimo"] = payload
+        stats["maximo"] = max(stats["maximo"], payload)
+        if payload > FIG_PAYLOAD_BUDGET_KB * 1024:
+            stats["excesos"] += 1
+            logger.warning(
+                "Grafico '%s' envia %.0f KB (presupuesto %.0f KB)",
+                nombre, payload / 1024, FIG_PAYLOAD_BUDGET_KB
+            )
+
+
+def mostrar_grafico(fig: go.Figure, nombre: str):
+    compactar_figura(fig)
+    if medir_payload(nombre):
+        registrar_payload(nombre, len(fig.to_json(validate=False).encode("utf-8")))
+    st.plotly_chart(fig, use_container_width=True)
+
+# -----------------------------------------------------------------------------
+# EXPORTACION DE DATOS FILTRADOS (CSV / PARQUET / XLSX)
+# -----------------------------------------------------------------------------
+# Los archivos se sirven desde disco con el static serving de Streamlit
+# (.streamlit/config.toml -> enableStaticServing): static/exports/x.csv queda
+# en app/static/exports/x.csv sin pasar por el media store en memoria. La
+# escritura corre en un pool aparte (ver mdbs_exportacion), no en el hilo del
+# script: la sesion solo sondea el trabajo.
+# El static serving responde 404 por encima de 200 MB (MAX_APP_STATIC_FILE_SIZE,
+# igual en 1.37 y 1.66) y entrega CSV / XLSX / Parquet como text/plain. Si
+# MDBS_EXPORT_URL apunta a la ruta /exportaciones de la API (ver mdbs_api), los
+# enlaces van ahi y no hay limite; si no, se avisa en vez de dar un enlace roto.
+EXPORT_URL = "app/static/exports"
+EXPORT_URL_API = os.environ.get("MDBS_EXPORT_URL", "").rstrip("/")
+STATIC_MAX_MB = 200
+EXPORT_MAX_EDAD_S = 24 * 60 * 60
+EXPORT_MAX_MB = 2048
+EXPORT_WORKERS = 2
+
+
+def limpiar_exportaciones():
+    # Borra lo que supera EXPORT_MAX_EDAD_S y, si aun se pasa de EXPORT_MAX_MB,
+    # los archivos mas antiguos primero. Los .tmp solo se tocan por edad (pueden
+    # estar escribiendose).
+    try:
+        entradas = [e for e in os.scandir(exp.EXPORT_DIR) if e.is_file()]
+    except OSError:
+        return
+    ahora = time.time()
+    vigentes = []
+    for entrada in entradas:
+        try:
+            stat = entrada.stat()
+            if ahora - stat.st_mtime > EXPORT_MAX_EDAD_S:
+                os.remove(entrada.path)
+            elif not entrada.name.endswith(".tmp"):
+                vigentes.append((stat.st_mtime, stat.st_size, entrada.path))
+        except OSError:
+            pass
+
+    total = sum(size for _, size, _ in vigentes)
+    for _, size, path in sorted(vigentes):
+        if total <= EXPORT_MAX_MB * 1024 * 1024:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+@st.cache_resource
+def get_pool_exportaciones():
+    return ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="exportacion")
+
+
+@st.cache_resource
+def get_trabajos_exportacion():
+    # path del archivo -> Future. Solo trabajos en curso o fallidos: uno que
+    # termino bien se reconoce porque el archivo existe.
+    return {"lock": threading.Lock(), "trabajos": {}}
+
+
+def ruta_exportacion(pagina: str, filtros: tuple, formato: str, version: str) -> str:
+    # Un archivo en disco por (pagina, filtros, formato, version), compartido
+    # entre sesiones.
+    clave = json.dumps([pagina, filtros, formato, version], default=str)
+    nombre = hashlib.sha1(clave.encode()).hexdigest()[:16]
+    return os.path.join(exp.EXPORT_DIR, f"{nombre}.{exp.FORMATOS_EXPORTACION[formato]}")
+
+
+def _generar_exportacion(path: str, path_parquet: str, formato: str, cargar_df):
+    # Corre en get_pool_exportaciones(). Siempre se parte del Parquet de los
+    # mismos filtros: CSV y XLSX se convierten desde el en un subproceso.
+    sufijo = f"{os.getpid()}.{threading.get_ident()}.tmp"
+    if not os.path.exists(path_parquet):
+        df = cargar_df()
+        if formato == "XLSX" and len(df) > exp.EXCEL_MAX_ROWS:
+            raise ValueError(f"{len(df):,} filas superan el maximo de Excel; usa CSV o Parquet.")
+        tmp_path = f"{path_parquet}.{sufijo}"
+        try:
+            exp.escribir_parquet(tmp_path, df)
+            os.replace(tmp_path, path_parquet)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        del df
+
+    if formato != "Parquet":
+        tmp_path = f"{path}.{sufijo}"
+        try:
+            exp.convertir_en_subproceso(path_parquet, tmp_path, formato)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return path
+
+
+def lanzar_exportacion(pagina: str, filtros: tuple, formato: str, version: str, cargar_df):
+    path = ruta_exportacion(pagina, filtros, formato, version)
+    path_parquet = ruta_exportacion(pagina, filtros, "Parquet", version)
+    registro = get_trabajos_exportacion()
+    with registro["lock"]:
+        for p, futuro in list(registro["trabajos"].items()):
+            if futuro.done() and os.path.exists(p):
+                del registro["trabajos"][p]
+        if os.path.exists(path):
+            return
+        futuro = registro["trabajos"].get(path)
+        if futuro is None or futuro.done():
+            os.makedirs(exp.EXPORT_DIR, exist_ok=True)
+            limpiar_exportaciones()
+            registro["trabajos"][path] = get_pool_exportaciones().submit(
+                _generar_exportacion, path, path_parquet, formato, cargar_df
+            )
+
+
+def trabajo_exportacion(path: str):
+    registro = get_trabajos_exportacion()
+    with registro["lock"]:
+        return registro["trabajos"].get(path)
+
+
+@st.fragment(run_every=2)
+def fragmento_progreso_exportacion(path: str):
+    # Sondea sin bloquear el script; al terminar, un rerun muestra el enlace.
+    futuro = trabajo_exportacion(path)
+    if futuro is not None and not futuro.done():
+        st.info("Generando archivo en segundo plano... puedes seguir usando la aplicación.")
+        return
+    st.rerun()
+
+
+@st.fragment
+def fragmento_exportacion(pagina: str, filtros: tuple, cargar_df):
+    # Preparar/descargar solo re-ejecuta este fragmento, no la pagina.
+    st.markdown("---")
+    st.markdown("**Exportar datos filtrados**")
+
+    formato = st.radio(
+        "Formato:", list(exp.FORMATOS_EXPORTACION.keys()), horizontal=True, key=f"export_fmt_{pagina}"
+    )
+    clave_pedido = f"export_pedido_{pagina}"
+    if st.button("Preparar archivo", key=f"export_btn_{pagina}"):
+        st.session_state[clave_pedido] = (filtros, formato)
+        lanzar_exportacion(pagina, filtros, formato, DATASET_VERSION, cargar_df)
+
+    if st.session_state.get(clave_pedido) != (filtros, formato):
+        return
+
+    path = ruta_exportacion(pagina, filtros, formato, DATASET_VERSION)
+    if not os.path.exists(path):
+        futuro = trabajo_exportacion(path)
+        if futuro is None:
+            # limpiar_exportaciones() lo borro o el servidor se reinicio.
+            st.info("El archivo ya no está disponible; vuelve a prepararlo.")
+        elif not futuro.done():
+            fragmento_progreso_exportacion(path)
+        elif isinstance(futuro.exception(), ValueError):
+            st.warning(str(futuro.exception()))
+        else:
+            st.error(f"Falló la exportación: {futuro.exception() or 'el archivo no existe.'}")
+        return
+
+    ext = exp.FORMATOS_EXPORTACION[formato]
+    nombre = f"{pagina.lower().replace(' ', '_')}_{DATASET_VERSION}.{ext}"
+    tamano_mb = os.path.getsize(path) / (1024 * 1024)
+    # Enlace al archivo en disco: el servidor lo lee al descargarlo, no se
+    # copia a la memoria de la sesion.
+    if EXPORT_URL_API:
+        href = f"{EXPORT_URL_API}/{os.path.basename(path)}?nombre={quote(nombre)}"
+    elif tamano_mb <= STATIC_MAX_MB:
+        href = f"{EXPORT_URL}/{os.path.basename(path)}"
     else:
-        df_agg["Periodo"] = df_agg[date_col].dt.strftime("%Y-%m")
+        st.warning(
+            f"El archivo pesa {tamano_mb:,.0f} MB y el servidor de archivos estáticos "
+            f"solo entrega hasta {STATIC_MAX_MB} MB. Acota los filtros o elige Parquet "
+            "(más compacto); para archivos grandes, configura MDBS_EXPORT_URL con la "
+            "ruta /exportaciones de la API."
+        )
+        return
+    st.markdown(
+        f'<a href="{href}" download="{nombre}">Descargar {formato} ({tamano_mb:,.1f} MB)</a>',
+        unsafe_allow_html=True
+    )
+
+# -----------------------------------------------------------------------------
+# WIDGETS CON FACETAS: SELECCION ESTABLE
+# -----------------------------------------------------------------------------
+# Las etiquetas con conteos dependen de los filtros de arriba. En las versiones
+# de Streamlit que calculan la identidad del widget con las opciones formateadas
+# (p.ej. 1.37, incluso con key=), cambiar un filtro superior crea un widget
+# nuevo y la seleccion vuelve al valor por defecto. Ademas de una key estable,
+# se guarda la ultima seleccion y se pasa como valor inicial.
+def indice_recordado(clave: str, opciones: list) -> int:
+    previo = st.session_state.get(f"{clave}__ultimo")
+    return opciones.index(previo) if previo in opciones else 0
+
 
-    return df_agg
+def seleccion_recordada(clave: str, opciones: list) -> list:
+    return [v for v in st.session_state.get(f"{clave}__ultimo", []) if v in opciones]
+
+
+def recordar_seleccion(clave: str, valor):
+    st.session_state[f"{clave}__ultimo"] = valor
+    return valor
 
 # -----------------------------------------------------------------------------
 # SUBPAGINA EJECUCION
@@ -158,22 +439,24 @@ def subpagina_ejecucion():
     st.markdown('<p class="subtitle">Subpagina: Ejecucion</p>', unsafe_allow_html=True)
 
     df_ejec = DATASETS["ACTIVITY_IADB"].copy()
+    facetas = construir_facetas("ACTIVITY_IADB", DATASET_VERSION, "Sector_1", ("Closed", "Finalisation"))
 
     st.sidebar.subheader("Filtros (Ejecucion)")
 
     # 1) Filtro Region
-    custom_5fp_countries = ["Argentina", "Bolivia (Plurinational State of)", "Brazil", "Paraguay", "Uruguay"]
-
     if "region" in df_ejec.columns:
-        real_regions = sorted(df_ejec["region"].dropna().unique().tolist())
-        # Insertamos "5-FP" solo si no existe
-        if "5-FP" not in real_regions:
+        conteo_reg = facetas["region"].get((), {})
+        real_regions = opciones_faceta(conteo_reg, excluir=("5-FP",))
+        # "5-FP" va primero, solo si tiene datos
+        if "5-FP" in conteo_reg:
             real_regions.insert(0, "5-FP")
 
-        sel_region = st.sidebar.selectbox("Region:", ["Todas"] + real_regions, index=0)
+        sel_region = st.sidebar.selectbox(
+            "Region:", ["Todas"] + real_regions, index=0, format_func=formato_faceta(conteo_reg)
+        )
 
         if sel_region == "5-FP":
-            df_ejec = df_ejec[df_ejec["recipientcountry_codename"].isin(custom_5fp_countries)]
+            df_ejec = df_ejec[df_ejec["recipientcountry_codename"].isin(PAISES_5FP)]
             if df_ejec.empty:
                 st.warning("No hay datos que correspondan a la región 5-FP.")
                 return
@@ -192,8 +475,12 @@ def subpagina_ejecucion():
 
     # 2) Filtro País (single select)
     if "recipientcountry_codename" in df_ejec.columns:
-        pais_list = sorted(df_ejec["recipientcountry_codename"].dropna().unique().tolist())
-        sel_country = st.sidebar.selectbox("País:", ["Todos"] + pais_list, index=0)
+        conteo_pais = facetas["pais"].get((sel_region,), {})
+        opt_pais = ["Todos"] + opciones_faceta(conteo_pais)
+        sel_country = recordar_seleccion("ejecucion_pais", st.sidebar.selectbox(
+            "País:", opt_pais, index=indice_recordado("ejecucion_pais", opt_pais),
+            format_func=formato_faceta(conteo_pais, "Todos"), key="ejecucion_pais"
+        ))
         if sel_country != "Todos":
             df_ejec = df_ejec[df_ejec["recipientcountry_codename"] == sel_country]
             if df_ejec.empty:
@@ -202,32 +489,33 @@ def subpagina_ejecucion():
     else:
         st.warning("No se encontró la columna 'recipientcountry_codename'.")
         return
-
-    # Filtro sector (multiselect)
-    if "Sector_1" in df_ejec.columns:
-        sector_list = sorted(df_ejec["Sector_1"].dropna().unique().tolist())
-        st.sidebar.markdown("**Selecciona uno o varios sectores:**")
-        sel_sectors = st.sidebar.multiselect("Sector_1:", sector_list, default=[])
-        if len(sector_list) > 0:
-            if sel_sectors:
-                df_ejec["sector_color"] = df_ejec["Sector_1"].apply(
-                    lambda x: x if x in sel_sectors else "Otros"
-                )
-            else:
-                df_ejec["sector_color"] = "Otros"
-        else:
-            df_ejec["sector_color"] = "Otros"
-    else:
-        df_ejec["sector_color"] = "Otros"
+    clave_pais = FACETA_TODAS if sel_country == "Todos" else sel_country
 
     # Filtro modalidad_general
+    sel_mod = "Todas"
     if "modalidad_general" in df_ejec.columns:
-        mod_list = sorted(df_ejec["modalidad_general"].dropna().unique().tolist())
-        opt_mod = ["Todas"] + mod_list
-        sel_mod = st.sidebar.selectbox("Modalidad:", opt_mod, index=0)
+        conteo_mod = facetas["modalidad"].get((sel_region, clave_pais), {})
+        opt_mod = ["Todas"] + opciones_faceta(conteo_mod)
+        sel_mod = recordar_seleccion("ejecucion_modalidad", st.sidebar.selectbox(
+            "Modalidad:", opt_mod, index=indice_recordado("ejecucion_modalidad", opt_mod),
+            format_func=formato_faceta(conteo_mod), key="ejecucion_modalidad"
+        ))
         if sel_mod != "Todas":
             df_ejec = df_ejec[df_ejec["modalidad_general"] == sel_mod]
 
+    # Filtro sector (multiselect, solo colorea)
+    df_ejec["sector_color"] = "Otros"
+    if "Sector_1" in df_ejec.columns:
+        conteo_sec = facetas["sector"].get((sel_region, clave_pais, sel_mod), {})
+        sector_list = opciones_faceta(conteo_sec)
+        st.sidebar.markdown("**Selecciona uno o varios sectores:**")
+        sel_sectors = recordar_seleccion("ejecucion_sectores", st.sidebar.multiselect(
+            "Sector_1:", sector_list, default=seleccion_recordada("ejecucion_sectores", sector_list),
+            format_func=formato_faceta(conteo_sec), key="ejecucion_sectores"
+        ))
+        if sel_sectors:
+            df_ejec["sector_color"] = df_ejec["Sector_1"].where(df_ejec["Sector_1"].isin(sel_sectors), "Otros")
+
     if df_ejec.empty:
         st.warning("No hay datos tras los filtros actuales (Ejecucion).")
         return
@@ -277,98 +565,114 @@ def subpagina_ejecucion():
                 paper_bgcolor="rgba(0,0,0,0)",
                 plot_bgcolor="rgba(0,0,0,0)"
             )
-            st.plotly_chart(fig, use_container_width=True)
+            mostrar_grafico(fig, "ejecucion_scatter")
     else:
         st.warning(f"Faltan columnas en DataFrame: {needed_cols - set(df_ejec.columns)}")
 
+    # "sector_color" es solo para el grafico: los sectores no filtran filas.
+    # El drop va dentro de la lambda: solo se copia el frame si hay que exportar.
+    fragmento_exportacion(
+        "Ejecucion", (sel_region, sel_country, sel_mod),
+        lambda: df_ejec.drop(columns="sector_color")
+    )
+
 
 # -----------------------------------------------------------------------------
 # SUBPAGINA FLUJOS AGREGADOS
 # -----------------------------------------------------------------------------
-def subpagina_flujos_agregados():
-    st.markdown('<p class="subtitle">Subpagina: Flujos Agregados</p>', unsafe_allow_html=True)
-
-    df_original = DATASETS["OUTGOING_COMMITMENT_IADB"].copy()
-    df_original["transactiondate_isodate"] = pd.to_datetime(df_original["transactiondate_isodate"])
+COLOR_PALETTE = [
+    "#4361ee",
+    "#E86D67",
+    "#FFFFFF",
+    "#59C3C3",
+    "#FBD48A",
+    "#B4B3B6",
+    "#22223B",
+    "#8A84C6"
+]
+
+
+def filtros_flujos_agregados():
+    # Estado de filtros (sidebar). Cada cambio aqui es un rerun completo: el
+    # filtrado son mascaras sobre el frame base, los agregados estan en cache.
+    df_base = get_flujos_base(DATASET_VERSION)
+    facetas = construir_facetas("OUTGOING_COMMITMENT_IADB", DATASET_VERSION, "Sector")
 
-    # -----------------------------
-    # Filtros
-    # -----------------------------
     st.sidebar.subheader("Filtros (Flujos Agregados)")
 
-    if "region" in df_original.columns:
-        region_list = sorted(df_original["region"].dropna().unique().tolist())
-        sel_region = st.sidebar.selectbox("Region:", ["Todas"] + region_list, 0)
+    if "region" in df_base.columns:
+        conteo_reg = facetas["region"].get((), {})
+        region_list = opciones_faceta(conteo_reg, excluir=("5-FP",))
+        if "5-FP" in conteo_reg:
+            region_list.insert(0, "5-FP")
+        sel_region = st.sidebar.selectbox(
+            "Region:", ["Todas"] + region_list, 0, format_func=formato_faceta(conteo_reg)
+        )
     else:
         sel_region = "Todas"
 
-    df_filtered_for_region = df_original.copy()
-    if sel_region != "Todas":
-        df_filtered_for_region = df_filtered_for_region[df_filtered_for_region["region"] == sel_region]
-
-    if "recipientcountry_codename" in df_filtered_for_region.columns:
-        pais_list = sorted(df_filtered_for_region["recipientcountry_codename"].dropna().unique().tolist())
-        opt_paises = ["Todas"] + pais_list
-        if sel_region == "Todas":
-            disabled_countries = True
-            sel_paises = ["Todas"]
-        else:
-            disabled_countries = False
-
+    if "recipientcountry_codename" in df_base.columns:
+        conteo_pais = facetas["pais"].get((sel_region,), {})
+        opt_paises = ["Todas"] + opciones_faceta(conteo_pais)
         sel_paises = st.sidebar.multiselect(
             "Pais(es):",
             opt_paises,
             default=["Todas"],
-            disabled=disabled_countries
+            disabled=(sel_region == "Todas"),
+            format_func=formato_faceta(conteo_pais)
         )
     else:
         sel_paises = ["Todas"]
 
-    df = df_filtered_for_region.copy()
-    if "modalidad_general" in df.columns:
-        m_list = sorted(df["modalidad_general"].dropna().unique().tolist())
-        opt_m = ["Todas"] + m_list
-        sel_mod = st.sidebar.selectbox("Modalidad (general):", opt_m, 0)
-        if sel_mod != "Todas":
-            df = df[df["modalidad_general"] == sel_mod]
-
+    sel_mod = "Todas"
+    if "modalidad_general" in df_base.columns:
+        if "Todas" in sel_paises:
+            conteo_mod = facetas["modalidad"].get((sel_region, FACETA_TODAS), {})
+        else:
+            conteo_mod = combinar_facetas(
+                facetas["modalidad"].get((sel_region, p), {}) for p in sel_paises
+            )
+        opt_m = ["Todas"] + opciones_faceta(conteo_mod)
+        sel_mod = recordar_seleccion("flujos_modalidad", st.sidebar.selectbox(
+            "Modalidad (general):", opt_m, indice_recordado("flujos_modalidad", opt_m),
+            format_func=formato_faceta(conteo_mod), key="flujos_modalidad"
+        ))
+
+    # Un solo filtrado desde el frame base; cada paso siguiente reduce el
+    # frame ya filtrado en vez de volver a escanear la base.
+    df = filtrar_flujos_agregados(sel_region, ("Todas",), sel_mod)
     if df.empty:
         st.warning("No hay datos tras los filtros de region/modalidad.")
-        return
+        return None
 
-    if "Todas" not in sel_paises:
-        if sel_paises:
-            df = df[df["recipientcountry_codename"].isin(sel_paises)]
-        else:
-            st.warning("No se seleccionó ningún país.")
-            return
+    if not sel_paises:
+        st.warning("No se seleccionó ningún país.")
+        return None
+    sel_paises = tuple(sel_paises)
 
+    df = filtrar_paises(df, sel_paises)
     if df.empty:
         st.warning("No hay datos tras filtrar país(es).")
-        return
+        return None
 
-    if "value_usd" in df.columns:
-        df["value_usd_millions"] = df["value_usd"] / 1_000_000
-        min_m = float(df["value_usd_millions"].min())
-        max_m = float(df["value_usd_millions"].max())
+    sel_range = None
+    limites = extremos_montos(df)
+    if limites is not None:
+        min_m, max_m = limites
         sel_range = st.sidebar.slider(
             "Rango Montos (Millones USD):",
             min_value=min_m,
             max_value=max_m,
             value=(min_m, max_m)
         )
-        df = df[
-            (df["value_usd_millions"] >= sel_range[0]) &
-            (df["value_usd_millions"] <= sel_range[1])
-        ]
+        df = filtrar_montos(df, sel_range)
 
-    if df.empty:
+    limites = extremos_anios(df)
+    if limites is None:
         st.warning("No hay datos tras filtrar por montos en millones.")
-        return
-
-    min_y = df["transactiondate_isodate"].dt.year.min()
-    max_y = df["transactiondate_isodate"].dt.year.max()
+        return None
 
+    min_y, max_y = limites
     start_year, end_year = st.sidebar.slider(
         "Rango de años:",
         min_value=int(min_y),
@@ -376,73 +680,25 @@ def subpagina_flujos_agregados():
         value=(int(min_y), int(max_y)),
         step=1
     )
-    start_ts = pd.to_datetime(datetime(start_year, 1, 1))
-    end_ts = pd.to_datetime(datetime(end_year, 12, 31))
-    df = df[
-        (df["transactiondate_isodate"] >= start_ts) &
-        (df["transactiondate_isodate"] <= end_ts)
-    ]
 
-    if df.empty:
+    filtros = (sel_region, sel_paises, sel_mod, sel_range, (start_year, end_year))
+    if filtrar_anios(df, filtros[4]).empty:
         st.warning("No hay datos tras filtrar por años.")
-        return
+        return None
 
-    freq_opts = ["Trimestral", "Semestral", "Anual"]
-    st.markdown("**Frecuencia**")
-    freq_choice = st.selectbox("", freq_opts, index=2, label_visibility="collapsed")
+    return filtros
 
-    if freq_choice == "Trimestral":
-        freq_code = "Q"
-        label_x = "Trimestre"
-        shift_periods = 4
-    elif freq_choice == "Semestral":
-        freq_code = "2Q"
-        label_x = "Semestre"
-        shift_periods = 2
-    else:
-        freq_code = "A"
-        label_x = "Año"
-        shift_periods = 1
+
+@st.fragment
+def fragmento_grafico_flujos(filtros: tuple, freq_choice: str):
+    # Solo el radio "Ver por" vive aqui: cambiarlo re-ejecuta este grafico.
+    label_x = FRECUENCIAS[freq_choice][1]
 
     vistas = ["Fechas", "Sectores"]
     vista = st.radio("Ver por:", vistas, horizontal=True)
 
-    if df.empty:
-        st.warning("No hay datos tras los filtros en Flujos Agregados.")
-        return
-
-    color_palette = [
-        "#4361ee",
-        "#E86D67",
-        "#FFFFFF",
-        "#59C3C3",
-        "#FBD48A",
-        "#B4B3B6",
-        "#22223B",
-        "#8A84C6"
-    ]
-
     if vista == "Fechas":
-        df.set_index("transactiondate_isodate", inplace=True)
-        df_agg = df["value_usd"].resample(freq_code).sum().reset_index()
-        df_agg["value_usd_millions"] = df_agg["value_usd"] / 1_000_000
-        df.reset_index(inplace=True)
-
-        if freq_choice == "Trimestral":
-            df_agg["Periodo"] = (
-                df_agg["transactiondate_isodate"].dt.year.astype(str)
-                + "T"
-                + df_agg["transactiondate_isodate"].dt.quarter.astype(str)
-            )
-        elif freq_choice == "Semestral":
-            sm = (df_agg["transactiondate_isodate"].dt.month.sub(1)//6).add(1)
-            df_agg["Periodo"] = (
-                df_agg["transactiondate_isodate"].dt.year.astype(str)
-                + "S"
-                + sm.astype(str)
-            )
-        else:
-            df_agg["Periodo"] = df_agg["transactiondate_isodate"].dt.year.astype(str)
+        df_agg = agregar_flujos_por_fechas(filtros, freq_choice)
 
         st.subheader("Stacked Ordered Bar (Fechas) - 1 Serie")
 
@@ -469,53 +725,14 @@ def subpagina_flujos_agregados():
             plot_bgcolor="rgba(0,0,0,0)"
         )
         fig_time.update_traces(marker_line_color="white", marker_line_width=1)
-        st.plotly_chart(fig_time, use_container_width=True)
+        mostrar_grafico(fig_time, "flujos_fechas")
 
     else:
-        if freq_choice == "Trimestral":
-            df["Periodo"] = (
-                df["transactiondate_isodate"].dt.year.astype(str)
-                + "T"
-                + df["transactiondate_isodate"].dt.quarter.astype(str)
-            )
-        elif freq_choice == "Semestral":
-            sm = (df["transactiondate_isodate"].dt.month.sub(1)//6).add(1)
-            df["Periodo"] = (
-                df["transactiondate_isodate"].dt.year.astype(str)
-                + "S"
-                + sm.astype(str)
-            )
-        else:
-            df["Periodo"] = df["transactiondate_isodate"].dt.year.astype(str)
-
-        df_agg_sec = df.groupby(["Periodo", "Sector"], as_index=False)["value_usd_millions"].sum()
-        if df_agg_sec.empty:
+        pivot_abs, pivot_pct, unique_sectors = agregar_flujos_por_sectores(filtros, freq_choice)
+        if pivot_abs.empty:
             st.warning("No hay datos en estos filtros (Sectores).")
             return
 
-        top_agg = df_agg_sec.groupby("Sector", as_index=False)["value_usd_millions"].sum()
-        top_agg = top_agg.sort_values("value_usd_millions", ascending=False)
-        top_7 = top_agg["Sector"].head(7).tolist()
-
-        df_agg_sec["Sector_stack"] = df_agg_sec["Sector"].apply(lambda s: s if s in top_7 else "OTROS")
-        df_agg_sec = df_agg_sec.groupby(["Periodo", "Sector_stack"], as_index=False)["value_usd_millions"].sum()
-
-        if df_agg_sec.empty:
-            st.warning("No hay datos después de agrupar top 7 + 'OTROS'.")
-            return
-
-        pivoted = df_agg_sec.pivot(index="Periodo", columns="Sector_stack", values="value_usd_millions").fillna(0)
-        sums = pivoted.sum(axis=1)
-        pivot_pct = pivoted.div(sums, axis=0) * 100
-        df_pct = pivot_pct.reset_index().melt(id_vars="Periodo", var_name="Sector_stack", value_name="pct_value")
-
-        sorted_top7 = sorted(top_7)
-        unique_sectors = sorted_top7 + ["OTROS"]
-
-        color_map = {}
-        for i, sector_n in enumerate(unique_sectors):
-            color_map[sector_n] = color_palette[i % len(color_palette)]
-
         fig_subplots = make_subplots(
             rows=2, cols=1,
             shared_xaxes=True,
@@ -529,41 +746,24 @@ def subpagina_flujos_agregados():
             height=800
         )
 
-        # BARRAS (abs)
-        for sector_n in unique_sectors:
-            df_temp_abs = df_agg_sec[df_agg_sec["Sector_stack"] == sector_n]
-            x_vals = df_temp_abs["Periodo"]
-            y_vals = df_temp_abs["value_usd_millions"]
-
-            fig_subplots.add_trace(
-                go.Bar(
-                    x=x_vals,
-                    y=y_vals,
-                    name=sector_n,
-                    legendgroup=sector_n,
-                    marker_color=color_map[sector_n],
-                    showlegend=True
-                ),
-                row=1, col=1
-            )
-
-        # BARRAS (%)
-        for sector_n in unique_sectors:
-            df_temp_pct = df_pct[df_pct["Sector_stack"] == sector_n]
-            x_vals = df_temp_pct["Periodo"]
-            y_vals = df_temp_pct["pct_value"]
-
-            fig_subplots.add_trace(
-                go.Bar(
-                    x=x_vals,
-                    y=y_vals,
-                    name=sector_n,
-                    legendgroup=sector_n,
-                    marker_color=color_map[sector_n],
-                    showlegend=False
-                ),
-                row=2, col=1
-            )
+        # BARRAS (abs) y (%): una columna del pivot por sector
+        periodos = pivot_abs.index.to_numpy()
+        for i, sector_n in enumerate(unique_sectors):
+            color = COLOR_PALETTE[i % len(COLOR_PALETTE)]
+            # Montos en float64; los porcentajes (0-100) no necesitan mas que float32
+            for fila, pivot, dtype, showlegend in ((1, pivot_abs, np.float64, True),
+                                                   (2, pivot_pct, np.float32, False)):
+                fig_subplots.add_trace(
+                    go.Bar(
+                        x=periodos,
+                        y=pivot[sector_n].to_numpy(dtype=dtype),
+                        name=sector_n,
+                        legendgroup=sector_n,
+                        marker_color=color,
+                        showlegend=showlegend
+                    ),
+                    row=fila, col=1
+                )
 
         fig_subplots.update_layout(
             barmode="stack",
@@ -583,102 +783,80 @@ def subpagina_flujos_agregados():
         fig_subplots.update_yaxes(title_text="Porcentaje (%)", row=2, col=1)
         fig_subplots.update_traces(marker_line_color="white", marker_line_width=1)
 
-        st.plotly_chart(fig_subplots, use_container_width=True)
+        mostrar_grafico(fig_subplots, "flujos_sectores")
 
-    st.info("Flujos agregados: Aprobaciones (Outgoing Commitments).")
 
-    st.markdown("---")
+def grafico_yoy_flujos(filtros: tuple, freq_choice: str):
+    sel_region, sel_paises, _, _, sel_years = filtros
+
     st.markdown("## Tasa de Crecimiento Interanual (YoY)")
 
-    df_global_all = df_original.copy()
-    df_global_all["transactiondate_isodate"] = pd.to_datetime(df_global_all["transactiondate_isodate"])
-    df_global_all = df_global_all[
-        (df_global_all["transactiondate_isodate"] >= start_ts) &
-        (df_global_all["transactiondate_isodate"] <= end_ts)
-    ]
+    df_yoy_final_all = calcular_yoy_flujos(sel_region, sel_paises, sel_years, freq_choice)
+    if df_yoy_final_all.empty:
+        st.warning("No se pudo calcular Tasa de Crecimiento Interanual con los filtros actuales.")
+        return
 
-    if sel_region != "Todas":
-        df_region_all = df_global_all[df_global_all["region"] == sel_region].copy()
-    else:
-        df_region_all = pd.DataFrame()
-
-    list_countries_data_all = []
-    if sel_region != "Todas" and ("Todas" not in sel_paises):
-        for c in sel_paises:
-            temp_df = df_region_all[df_region_all["recipientcountry_codename"] == c]
-            if not temp_df.empty:
-                list_countries_data_all.append((c, temp_df))
-
-    yoy_list_all = []
-    if not df_global_all.empty:
-        yoy_g_all = compute_yoy(
-            df_global_all,
-            date_col="transactiondate_isodate",
-            value_col="value_usd",
-            freq_code=freq_code,
-            shift_periods=shift_periods
-        )
-        yoy_g_all["Categoria"] = "Global"
-        yoy_list_all.append(yoy_g_all)
-
-    if not df_region_all.empty:
-        yoy_r_all = compute_yoy(
-            df_region_all,
-            date_col="transactiondate_isodate",
-            value_col="value_usd",
-            freq_code=freq_code,
-            shift_periods=shift_periods
-        )
-        yoy_r_all["Categoria"] = f"Región: {sel_region}"
-        yoy_list_all.append(yoy_r_all)
-
-    for (country_name, df_country_all) in list_countries_data_all:
-        yoy_c_all = compute_yoy(
-            df_country_all,
-            date_col="transactiondate_isodate",
-            value_col="value_usd",
-            freq_code=freq_code,
-            shift_periods=shift_periods
+    fig_yoy_all = px.line(
+        df_yoy_final_all,
+        x="Periodo",
+        y="yoy",
+        color="Categoria",
+        markers=True,
+        line_shape="spline",
+        title="",
+        labels={
+            "Periodo": "Periodo",
+            "yoy": "Crec. Interanual (%)",
+            "Categoria": ""
+        }
+    )
+    fig_yoy_all.add_hline(
+        y=0,
+        line_dash="dot",
+        line_color="white"
+    )
+    fig_yoy_all.update_layout(
+        font_color="#FFFFFF",
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="center",
+            x=0.5
         )
-        yoy_c_all["Categoria"] = f"País: {country_name}"
-        yoy_list_all.append(yoy_c_all)
+    )
+    mostrar_grafico(fig_yoy_all, "flujos_yoy")
 
-    if yoy_list_all:
-        df_yoy_final_all = pd.concat(yoy_list_all, ignore_index=True)
-        fig_yoy_all = px.line(
-            df_yoy_final_all,
-            x="Periodo",
-            y="yoy",
-            color="Categoria",
-            markers=True,
-            line_shape="spline",
-            title="",
-            labels={
-                "Periodo": "Periodo",
-                "yoy": "Crec. Interanual (%)",
-                "Categoria": ""
-            }
-        )
-        fig_yoy_all.add_hline(
-            y=0,
-            line_dash="dot",
-            line_color="white"
-        )
-        fig_yoy_all.update_layout(
-            font_color="#FFFFFF",
-            paper_bgcolor="rgba(0,0,0,0)",
-            plot_bgcolor="rgba(0,0,0,0)",
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="center",
-                x=0.5
-            )
-        )
-        st.plotly_chart(fig_yoy_all, use_container_width=True)
-    else:
-        st.warning("No se pudo calcular Tasa de Crecimiento Interanual con los filtros actuales.")
+
+@st.fragment
+def fragmento_graficos_flujos(filtros: tuple):
+    # "Frecuencia" afecta al grafico principal y al YoY, pero no a los filtros:
+    # cambiarla re-ejecuta solo este fragmento (y el grafico anidado).
+    freq_opts = list(FRECUENCIAS.keys())
+    st.markdown("**Frecuencia**")
+    freq_choice = st.selectbox("", freq_opts, index=2, label_visibility="collapsed")
+    registrar_uso("Flujos Agregados", [filtros, freq_choice])
+
+    fragmento_grafico_flujos(filtros, freq_choice)
+
+    st.info("Flujos agregados: Aprobaciones (Outgoing Commitments).")
+
+    st.markdown("---")
+    grafico_yoy_flujos(filtros, freq_choice)
+
+
+def subpagina_flujos_agregados():
+    st.markdown('<p class="subtitle">Subpagina: Flujos Agregados</p>', unsafe_allow_html=True)
+
+    filtros = filtros_flujos_agregados()
+    if filtros is None:
+        return
+
+    fragmento_graficos_flujos(filtros)
+
+    fragmento_exportacion("Flujos Agregados", filtros, lambda: filtrar_flujos_agregados(*filtros))
 
 
 # -----------------------------------------------------------------------------
@@ -733,7 +911,7 @@ def series_temporales():
                 paper_bgcolor="rgba(0,0,0,0)",
                 plot_bgcolor="rgba(0,0,0,0)"
             )
-            st.plotly_chart(fig_line, use_container_width=True)
+            mostrar_grafico(fig_line, "series_temporales")
         else:
             st.info("No existe 'value_usd' para graficar en line chart.")
     else:
@@ -767,10 +945,8 @@ def multidimensional_y_relaciones():
     st.markdown('<h1 class="title">Multidimensional y Relaciones</h1>', unsafe_allow_html=True)
     st.markdown('<p class="subtitle">Ejemplo: matriz de correlacion (placeholder)</p>', unsafe_allow_html=True)
 
-    df_multi = DATASETS["ACTIVITY_IADB"].copy()
-    numeric_cols = df_multi.select_dtypes(include=[float, int]).columns
-    if len(numeric_cols) > 1:
-        corr = df_multi[numeric_cols].corr()
+    corr = calcular_correlaciones(DATASET_VERSION)
+    if corr is not None:
         fig_corr = px.imshow(
             corr,
             text_auto=True,
@@ -781,18 +957,175 @@ def multidimensional_y_relaciones():
             paper_bgcolor="rgba(0,0,0,0)",
             plot_bgcolor="rgba(0,0,0,0)"
         )
-        st.plotly_chart(fig_corr, use_container_width=True)
+        mostrar_grafico(fig_corr, "correlaciones")
     else:
         st.info("No hay suficientes columnas numéricas para correlacionar.")
 
 # -----------------------------------------------------------------------------
-# MODELOS (EJEMPLO)
+# MODELOS
 # -----------------------------------------------------------------------------
+# Entrenamiento en un subproceso "python -m mdbs_modelos" (lee su propio
+# parquet), esperado desde un ThreadPoolExecutor de un hilo. Los modelos quedan
+# en disco por version de datos + hiperparametros (ver mdbs_modelos.ruta_modelo);
+# en memoria solo los ultimos MODELOS_EN_MEMORIA que se consultaron.
+ESTADOS_ACTIVOS = ["Implementation"]
+MODELOS_EN_MEMORIA = 4
+
+
+@st.cache_resource
+def get_pool_modelos():
+    # Un hilo que solo espera al subproceso "python -m mdbs_modelos": el
+    # trabajo pesado no comparte GIL ni memoria con el servidor.
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="entrenamiento")
+
+
+@st.cache_resource
+def get_trabajos_modelos():
+    # path del modelo -> Future. Compartido entre sesiones: dos analistas que
+    # piden el mismo modelo esperan el mismo trabajo.
+    return {"lock": threading.Lock(), "trabajos": {}}
+
+
+def lanzar_entrenamiento(version: str, objetivo: str, hiperparametros: dict):
+    path = ml.ruta_modelo(version, objetivo, hiperparametros)
+    registro = get_trabajos_modelos()
+    with registro["lock"]:
+        futuro = registro["trabajos"].get(path)
+        if futuro is None or trabajo_fallido(futuro, path):
+            futuro = get_pool_modelos().submit(
+                ml.entrenar_en_subproceso, version, objetivo, hiperparametros
+            )
+            registro["trabajos"][path] = futuro
+    return futuro
+
+
+def trabajo_modelo(path: str):
+    registro = get_trabajos_modelos()
+    with registro["lock"]:
+        return registro["trabajos"].get(path)
+
+
+def trabajo_fallido(futuro, path: str) -> bool:
+    # Terminado sin excepcion pero sin .joblib (p.ej. borrado despues) tambien
+    # cuenta como fallo: si no, nadie lo relanza y el fragmento reintenta sin fin.
+    return futuro.done() and (futuro.exception() is not None or not os.path.exists(path))
+
+
+def error_trabajo(futuro) -> str:
+    return str(futuro.exception() or "el archivo del modelo no existe.")
+
+
+@st.cache_resource(show_spinner=False, max_entries=MODELOS_EN_MEMORIA)
+def cargar_modelo_entrenado(path: str):
+    return ml.cargar_modelo(path)
+
+
+@st.cache_data(show_spinner=False, max_entries=MODELOS_EN_MEMORIA)
+def puntuar_proyectos_activos(path: str, version: str):
+    resultado = cargar_modelo_entrenado(path)
+    df = DATASETS["ACTIVITY_IADB"]
+    if "activitystatus_codename" in df.columns:
+        df = df[df["activitystatus_codename"].isin(ESTADOS_ACTIVOS)]
+    if df.empty:
+        return pd.DataFrame()
+
+    columnas = [c for c in ["iatiidentifier", "title_narrative"] if c in df.columns]
+    columnas += resultado["categoricas"] + resultado["numericas"]
+    df_pred = df[columnas].copy()
+    df_pred["prediccion"] = ml.predecir(resultado, df)
+    return df_pred
+
+
+def resultados_modelo(path: str, version: str):
+    resultado = cargar_modelo_entrenado(path)
+    etiqueta = ml.OBJETIVOS[resultado["objetivo"]]
+
+    st.subheader("Validación cruzada")
+    df_cv = resultado["cv"]
+    c1, c2, c3 = st.columns(3)
+    c1.metric("MAE medio", f"{df_cv['MAE'].mean():.2f}")
+    c2.metric("RMSE medio", f"{df_cv['RMSE'].mean():.2f}")
+    c3.metric("R2 medio", f"{df_cv['R2'].mean():.2f}")
+    st.dataframe(df_cv, use_container_width=True, hide_index=True)
+    st.caption(f"Entrenado con {resultado['n_filas']:,} proyectos (datos {resultado['version']}).")
+
+    st.subheader("Predicción para proyectos activos")
+    df_pred = puntuar_proyectos_activos(path, version)
+    if df_pred.empty:
+        st.warning("No hay proyectos activos para puntuar.")
+        return
+
+    fig_pred = px.histogram(
+        df_pred,
+        x="prediccion",
+        color_discrete_sequence=["#4361ee"],
+        title="",
+        labels={"prediccion": etiqueta}
+    )
+    fig_pred.update_layout(
+        font_color="#FFFFFF",
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)"
+    )
+    mostrar_grafico(fig_pred, "modelos_prediccion")
+    st.dataframe(
+        df_pred.sort_values("prediccion", ascending=False).rename(columns={"prediccion": etiqueta}),
+        use_container_width=True,
+        hide_index=True
+    )
+
+
+@st.fragment(run_every=5)
+def fragmento_estado_entrenamiento(path: str):
+    # Sondea el trabajo sin bloquear el script. Al terminar (bien o mal) hace
+    # un rerun completo: modelos() muestra resultados o el error y el boton,
+    # y este fragmento deja de dibujarse.
+    futuro = trabajo_modelo(path)
+    if futuro is not None and not futuro.done():
+        st.info("Entrenando modelo en segundo plano... puedes seguir usando la aplicación.")
+        return
+    st.rerun()
+
+
 def modelos():
     st.markdown('<h1 class="title">Modelos</h1>', unsafe_allow_html=True)
-    st.markdown('<p class="subtitle">Placeholder de entrenamiento de modelos</p>', unsafe_allow_html=True)
+    st.markdown(
+        '<p class="subtitle">Predicción de atraso y duración real (HistGradientBoosting)</p>',
+        unsafe_allow_html=True
+    )
+
+    st.sidebar.subheader("Modelo")
+    objetivo = st.sidebar.selectbox(
+        "Variable objetivo:", list(ml.OBJETIVOS.keys()), index=0, format_func=ml.OBJETIVOS.get
+    )
+    defecto = ml.HIPERPARAMETROS_DEFECTO
+    hiperparametros = {
+        "learning_rate": st.sidebar.select_slider(
+            "learning_rate:", options=[0.01, 0.03, 0.05, 0.1, 0.2, 0.3], value=defecto["learning_rate"]
+        ),
+        "max_iter": st.sidebar.slider("max_iter:", 50, 1000, defecto["max_iter"], step=50),
+        "max_leaf_nodes": st.sidebar.slider("max_leaf_nodes:", 4, 128, defecto["max_leaf_nodes"]),
+        "min_samples_leaf": st.sidebar.slider("min_samples_leaf:", 1, 100, defecto["min_samples_leaf"]),
+    }
 
-    st.write("Ejemplo: Carga scikit-learn y entrena un modelo. Placeholder...")
+    categoricas, numericas = ml.features_disponibles(DATASETS["ACTIVITY_IADB"])
+    st.caption("Variables: " + ", ".join(categoricas + numericas))
+
+    path = ml.ruta_modelo(DATASET_VERSION, objetivo, hiperparametros)
+    if os.path.exists(path):
+        resultados_modelo(path, DATASET_VERSION)
+        return
+
+    futuro = trabajo_modelo(path)
+    if futuro is None or trabajo_fallido(futuro, path):
+        if futuro is not None:
+            st.error(f"Falló el entrenamiento anterior: {error_trabajo(futuro)}")
+        st.info("No hay un modelo entrenado para estos datos e hiperparámetros.")
+        if not st.button("Entrenar modelo"):
+            return
+        lanzar_entrenamiento(DATASET_VERSION, objetivo, hiperparametros)
+
+    fragmento_estado_entrenamiento(path)
 
 # -----------------------------------------------------------------------------
 # ANALISIS EXPLORATORIO (PyGWalker)
@@ -804,7 +1137,8 @@ def analisis_exploratorio():
     st.sidebar.header("Selecciona la BDD para analizar:")
     ds_list = list(DATASETS.keys())
     sel_ds = st.sidebar.selectbox("Dataset:", ds_list, index=0)
-    renderer = get_pyg_renderer_by_name(sel_ds)
+    registrar_uso("Analisis Exploratorio", sel_ds)
+    renderer = get_pyg_renderer_by_name(sel_ds, DATASET_VERSION)
     renderer.explorer()
 
 # -----------------------------------------------------------------------------
@@ -838,6 +1172,11 @@ PAGINAS = {
 }
 
 def main():
+    # Con "streamlit run" directo los servicios arrancan aqui; con
+    # mdbs_server.py ya estan en marcha y estas llamadas no hacen nada.
+    iniciar_servicios()
+    iniciar_api_agregados()
+
     st.sidebar.title("Navegacion")
     choice = st.sidebar.selectbox("Ir a:", list(PAGINAS.keys()), index=0)
     PAGINAS[choice]()
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import streamlit as st
+
+import mdbs_exportacion as exp
+from mdbs_datos import (
+    FRECUENCIAS,
+    agregar_flujos_por_fechas,
+    calcular_yoy_flujos,
+    completar_filtros_flujos,
+    dataset_version,
+    sincronizar_caches,
+)
+
+# -----------------------------------------------------------------------------
+# API LOCAL DE AGREGADOS (HTTP/JSON)
+# -----------------------------------------------------------------------------
+# Servidor HTTP en un hilo del mismo proceso que Streamlit: usa los mismos
+# dataframes y los mismos cache_data que Flujos Agregados. Vive en su propio
+# modulo para que mdbs_server.py lo arranque con el proceso, sin esperar a la
+# primera sesion. Ejemplo:
+#   curl "http://127.0.0.1:8502/api/aprobaciones?region=Sudamerica&pais=Brazil&frecuencia=Trimestral"
+# Parametros: region (incluye 5-FP), pais (repetible, exige region), modalidad,
+# monto_min / monto_max (millones USD), anio_desde / anio_hasta, frecuencia.
+# Tambien sirve las exportaciones de static/exports en /exportaciones/<archivo>
+# (?nombre= fija el nombre de descarga): el static serving de Streamlit corta
+# en 200 MB y entrega CSV / XLSX / Parquet como text/plain.
+API_HOST = os.environ.get("MDBS_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("MDBS_API_PORT", "8502"))  # 0 desactiva la API
+
+
+def _parametro(params: dict, nombre: str, defecto=None):
+    valores = params.get(nombre)
+    return valores[-1] if valores else defecto
+
+
+def _par_numerico(params: dict, nombres: tuple, tipo):
+    valores = tuple(_parametro(params, nombre) for nombre in nombres)
+    if all(valor is None for valor in valores):
+        return None
+    return tuple(None if valor is None else tipo(valor) for valor in valores)
+
+
+def filtros_desde_query(params: dict):
+    sel_region = _parametro(params, "region", "Todas")
+    sel_paises = tuple(params.get("pais", [])) or ("Todas",)
+    sel_mod = _parametro(params, "modalidad", "Todas")
+    freq_choice = _parametro(params, "frecuencia", "Anual")
+    if freq_choice not in FRECUENCIAS:
+        raise ValueError(f"frecuencia debe ser una de {list(FRECUENCIAS)}")
+    if sel_region == "Todas" and "Todas" not in sel_paises:
+        # En el dashboard el selector de paises esta deshabilitado sin region;
+        # /aprobaciones filtraria por pais y /yoy no: se rechaza la combinacion.
+        raise ValueError("pais requiere una region distinta de 'Todas'")
+
+    # Los extremos ausentes toman el valor por defecto de los sliders, asi la
+    # consulta comparte clave de cache (y ETag) con el dashboard. Los limites
+    # salen de cache_data: un sondeo que termina en 304 no escanea el frame.
+    filtros = completar_filtros_flujos(
+        sel_region, sel_paises, sel_mod,
+        _par_numerico(params, ("monto_min", "monto_max"), float),
+        _par_numerico(params, ("anio_desde", "anio_hasta"), int)
+    )
+    return filtros, freq_choice
+
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def responder_api(endpoint: str, filtros: tuple, freq_choice: str, version: str) -> bytes:
+    if endpoint == "aprobaciones":
+        df = agregar_flujos_por_fechas(filtros, freq_choice)
+        df = df[["Periodo", "transactiondate_isodate", "value_usd", "value_usd_millions"]]
+    else:
+        sel_region, sel_paises, _, _, sel_years = filtros
+        df = calcular_yoy_flujos(sel_region, sel_paises, sel_years, freq_choice)
+
+    sel_region, sel_paises, sel_mod, sel_range, sel_years = filtros
+    cuerpo = {
+        "version": version,
+        "frecuencia": freq_choice,
+        "filtros": {
+            "region": sel_region,
+            "paises": list(sel_paises),
+            "modalidad": sel_mod,
+            "montos": sel_range,
+            "anios": sel_years,
+        },
+        "datos": json.loads(df.to_json(orient="records", date_format="iso")),
+    }
+    return json.dumps(cuerpo, ensure_ascii=False, allow_nan=False, default=str).encode("utf-8")
+
+
+def nombre_descarga(nombre: str, defecto: str) -> str:
+    # Solo caracteres seguros dentro de Content-Disposition
+    limpio = re.sub(r"[^A-Za-z0-9._-]", "_", nombre or "").strip("._")
+    return limpio or defecto
+
+
+class ApiAgregadosHandler(BaseHTTPRequestHandler):
+    ENDPOINTS = ("aprobaciones", "yoy")
+
+    def _enviar(self, status: int, cuerpo: bytes = b"", etag: str = None):
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        if cuerpo:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        if cuerpo:
+            self.wfile.write(cuerpo)
+
+    def _error(self, status: int, mensaje: str):
+        self._enviar(status, json.dumps({"error": mensaje}, ensure_ascii=False).encode("utf-8"))
+
+    def _enviar_exportacion(self, url):
+        archivo = url.path[len("/exportaciones/"):]
+        path = os.path.join(exp.EXPORT_DIR, archivo)
+        if not exp.PATRON_ARCHIVO.match(archivo) or not os.path.isfile(path):
+            self._error(404, f"Exportacion no encontrada: {archivo}")
+            return
+        ext = archivo.rsplit(".", 1)[-1]
+        nombre = nombre_descarga(_parametro(parse_qs(url.query), "nombre"), archivo)
+        if not nombre.endswith(f".{ext}"):
+            nombre = f"{nombre}.{ext}"
+        try:
+            # Abierto antes de responder: si limpiar_exportaciones() lo borra
+            # despues, el descriptor sigue siendo valido.
+            f = open(path, "rb")
+        except OSError:
+            self._error(404, f"Exportacion no encontrada: {archivo}")
+            return
+        with f:
+            self.send_response(200)
+            self.send_header("Content-Type", exp.TIPOS_MIME[ext])
+            self.send_header("Content-Disposition", f'attachment; filename="{nombre}"')
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.send_header("X-Content-Type-Options", "nosniff")
+            self.end_headers()
+            try:
+                shutil.copyfileobj(f, self.wfile, 1 << 20)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # descarga cancelada por el cliente
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith("/exportaciones/"):
+            # Archivos ya generados: no dependen de la version de datos.
+            self._enviar_exportacion(url)
+            return
+
+        # La version se mira en cada peticion (solo os.stat): si los parquet
+        # cambiaron se invalidan los caches aunque no haya sesiones abiertas.
+        try:
+            version = dataset_version()
+        except OSError as exc:
+            # Parquet en plena sustitucion: que el cliente reintente.
+            self._error(503, f"Datos no disponibles: {exc}")
+            return
+        sincronizar_caches(version)
+        endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+
+        if url.path.rstrip("/") == "/api/version":
+            self._enviar(200, json.dumps({"version": version}).encode("utf-8"))
+            return
+        if not url.path.startswith("/api/") or endpoint not in self.ENDPOINTS:
+            self._error(404, f"Ruta no encontrada: {url.path}")
+            return
+
+        try:
+            filtros, freq_choice = filtros_desde_query(parse_qs(url.query))
+        except ValueError as exc:
+            self._error(400, str(exc))
+            return
+
+        # El ETag depende solo de la version de datos y de la consulta
+        # normalizada: se puede responder 304 sin tocar los agregados.
+        clave = json.dumps([version, endpoint, filtros, freq_choice], default=str)
+        etag = f'"{hashlib.sha1(clave.encode()).hexdigest()[:20]}"'
+        if etag in self.headers.get("If-None-Match", ""):
+            self._enviar(304, etag=etag)
+            return
+
+        try:
+            cuerpo = responder_api(endpoint, filtros, freq_choice, version)
+        except Exception as exc:
+            self._error(500, f"{type(exc).__name__}: {exc}")
+            return
+        self._enviar(200, cuerpo, etag=etag)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@st.cache_resource
+def iniciar_api_agregados():
+    if API_PORT <= 0:
+        return None
+    try:
+        servidor = ThreadingHTTPServer((API_HOST, API_PORT), ApiAgregadosHandler)
+    except OSError:
+        # Puerto ocupado (p.ej. otro worker ya expone la API).
+        return None
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="api-agregados", daemon=True).start()
+    return servidor
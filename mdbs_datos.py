@@ -0,0 +1,587 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+# -----------------------------------------------------------------------------
+# CAPA DE DATOS COMPARTIDA (SIN ELEMENTOS DE PAGINA)
+# -----------------------------------------------------------------------------
+# Modulo importable: mdbs-app.py lo usa en cada rerun y mdbs_server.py lo
+# importa al arrancar el proceso, antes de que exista la primera sesion. Como
+# es el mismo modulo (sys.modules), los st.cache_* que se llenan al arrancar
+# son los mismos que leen las paginas.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------------------------------------------------------------
+# 1) CARGA DE DATOS (CACHE)
+# -----------------------------------------------------------------------------
+ARCHIVOS_DATOS = {
+    "ACTIVITY_IADB": os.path.join(BASE_DIR, "activity_iadb.parquet"),
+    "OUTGOING_COMMITMENT_IADB": os.path.join(BASE_DIR, "outgoing_commitment_iadb.parquet"),
+    "DISBURSEMENTS_DATA": os.path.join(BASE_DIR, "disbursements_data.parquet")
+}
+
+
+def dataset_version() -> str:
+    # Cambia cuando se reemplaza cualquiera de los parquet (mtime/tamaño).
+    firma = hashlib.sha1()
+    for path in ARCHIVOS_DATOS.values():
+        stat = os.stat(path)
+        firma.update(f"{os.path.basename(path)}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+    return firma.hexdigest()[:12]
+
+
+@st.cache_resource
+def get_version_activa():
+    return {"lock": threading.Lock(), "version": None}
+
+
+def sincronizar_caches(version: str):
+    # Los cache_data que filtran por valores de widgets no reciben la version
+    # como argumento: si los datos cambian en disco se invalidan todos.
+    activa = get_version_activa()
+    with activa["lock"]:
+        if activa["version"] is not None and activa["version"] != version:
+            st.cache_data.clear()
+        activa["version"] = version
+
+
+def version_activa() -> str:
+    activa = get_version_activa()
+    if activa["version"] is None:
+        sincronizar_caches(dataset_version())
+    return activa["version"]
+
+
+@st.cache_resource(max_entries=1)
+def load_dataframes(version: str):
+    # Solo lectura: compartido entre sesiones, hilos de precalentamiento y la
+    # API. Quien necesite modificar un frame hace .copy() primero.
+    return {
+        nombre: pd.read_parquet(path)
+        for nombre, path in ARCHIVOS_DATOS.items()
+    }
+
+# -----------------------------------------------------------------------------
+# 2) CREACION DEL RENDERER DE PYGWALKER (CACHE)
+# -----------------------------------------------------------------------------
+@st.cache_resource
+def get_pyg_renderer_by_name(dataset_name: str, version: str):
+    from pygwalker.api.streamlit import StreamlitRenderer
+    df = load_dataframes(version)[dataset_name]
+    return StreamlitRenderer(df, kernel_computation=True)
+
+# -----------------------------------------------------------------------------
+# 3) FACETAS: CONTEOS EN CASCADA REGION -> PAIS -> MODALIDAD -> SECTOR (CACHE)
+# -----------------------------------------------------------------------------
+FACETA_TODAS = "Todas"
+PAISES_5FP = ["Argentina", "Bolivia (Plurinational State of)", "Brazil", "Paraguay", "Uruguay"]
+
+
+def _sumar_faceta(nivel: dict, clave: tuple, opcion, n: int, usd: float):
+    conteos = nivel.setdefault(clave, {})
+    n_prev, usd_prev = conteos.get(opcion, (0, 0.0))
+    conteos[opcion] = (n_prev + n, usd_prev + usd)
+
+
+@st.cache_data(show_spinner=False)
+def construir_facetas(dataset_name: str, version: str, col_sector: str, estados: tuple = None):
+    # Conteos de filas y totales USD por version de datos. Cada nivel es un
+    # dict indexado por la seleccion de los niveles superiores (FACETA_TODAS
+    # como comodin): las opciones en cascada se leen sin escanear el df.
+    df = load_dataframes(version)[dataset_name]
+    if estados is not None and "activitystatus_codename" in df.columns:
+        df = df[df["activitystatus_codename"].isin(estados)]
+
+    cols = ["region", "recipientcountry_codename", "modalidad_general", col_sector]
+    base = pd.DataFrame({c: df[c] if c in df.columns else "N/D" for c in cols})
+    base["value_usd"] = df["value_usd"] if "value_usd" in df.columns else 0.0
+
+    g = base.groupby(cols, dropna=False)["value_usd"].agg(["size", "sum"]).reset_index()
+
+    facetas = {"region": {}, "pais": {}, "modalidad": {}, "sector": {}}
+    for region, pais, mod, sector, n, usd in g.itertuples(index=False):
+        region, pais, mod, sector = (None if pd.isna(v) else v for v in (region, pais, mod, sector))
+        usd = 0.0 if pd.isna(usd) else float(usd)
+
+        regiones = [FACETA_TODAS] + ([region] if region is not None else [])
+        if pais in PAISES_5FP:
+            regiones.append("5-FP")
+        paises = [FACETA_TODAS] + ([pais] if pais is not None else [])
+        mods = [FACETA_TODAS] + ([mod] if mod is not None else [])
+        sectores = [FACETA_TODAS] + ([sector] if sector is not None else [])
+
+        for r in regiones:
+            _sumar_faceta(facetas["region"], (), r, n, usd)
+            for p in paises:
+                _sumar_faceta(facetas["pais"], (r,), p, n, usd)
+                for m in mods:
+                    _sumar_faceta(facetas["modalidad"], (r, p), m, n, usd)
+                    for s in sectores:
+                        _sumar_faceta(facetas["sector"], (r, p, m), s, n, usd)
+
+    return facetas
+
+
+def opciones_faceta(conteos: dict, excluir=()) -> list:
+    return sorted(o for o in conteos if o != FACETA_TODAS and o not in excluir)
+
+
+def combinar_facetas(lista_conteos) -> dict:
+    combinado = {}
+    for conteos in lista_conteos:
+        for opcion, (n, usd) in conteos.items():
+            n_prev, usd_prev = combinado.get(opcion, (0, 0.0))
+            combinado[opcion] = (n_prev + n, usd_prev + usd)
+    return combinado
+
+
+def formato_faceta(conteos: dict, etiqueta_todas: str = FACETA_TODAS):
+    def _formato(opcion):
+        clave = FACETA_TODAS if opcion == etiqueta_todas else opcion
+        if clave not in conteos:
+            return str(opcion)
+        n, usd = conteos[clave]
+        return f"{opcion} ({n:,} | {usd / 1_000_000:,.0f} M USD)"
+    return _formato
+
+
+# -----------------------------------------------------------------------------
+# FLUJOS AGREGADOS (DATOS)
+# -----------------------------------------------------------------------------
+# Frecuencia -> (codigo de resample, etiqueta eje X, periodos para YoY)
+FRECUENCIAS = {
+    "Trimestral": ("Q", "Trimestre", 4),
+    "Semestral": ("2Q", "Semestre", 2),
+    "Anual": ("A", "Año", 1),
+}
+
+# El slider de montos devuelve floats arbitrarios: acotar las combinaciones
+# que quedan en memoria.
+AGREGADOS_MAX_ENTRIES = 256
+AGREGADOS_TTL_S = 60 * 60
+
+
+def compute_yoy(df: pd.DataFrame, date_col: str, value_col: str, freq_code: str, shift_periods: int):
+    df_resampled = df.copy()
+    df_resampled.set_index(date_col, inplace=True)
+
+    df_agg = df_resampled[value_col].resample(freq_code).sum().reset_index()
+    df_agg = df_agg.sort_values(date_col)
+    df_agg["yoy"] = df_agg[value_col].pct_change(periods=shift_periods) * 100
+
+    if freq_code.upper() == "A":  
+        df_agg["Periodo"] = df_agg[date_col].dt.year.astype(str)
+    elif freq_code.upper() in ["Q", "3M"]:  
+        df_agg["Periodo"] = (
+            df_agg[date_col].dt.year.astype(str) + "T" + df_agg[date_col].dt.quarter.astype(str)
+        )
+    elif freq_code.upper() in ["6M", "2Q"]:  
+        sm = (df_agg[date_col].dt.month.sub(1)//6).add(1)
+        df_agg["Periodo"] = df_agg[date_col].dt.year.astype(str) + "S" + sm.astype(str)
+    else:
+        df_agg["Periodo"] = df_agg[date_col].dt.strftime("%Y-%m")
+
+    return df_agg
+
+
+@st.cache_resource(max_entries=1)
+def get_flujos_base(version: str):
+    # Solo lectura: se comparte entre sesiones, no modificar in-place.
+    df = load_dataframes(version)["OUTGOING_COMMITMENT_IADB"].copy()
+    df["transactiondate_isodate"] = pd.to_datetime(df["transactiondate_isodate"])
+    if "value_usd" in df.columns:
+        df["value_usd_millions"] = df["value_usd"] / 1_000_000
+    return df
+
+
+def filtrar_region(df: pd.DataFrame, sel_region: str) -> pd.DataFrame:
+    if sel_region == "5-FP":
+        return df[df["recipientcountry_codename"].isin(PAISES_5FP)]
+    if sel_region != "Todas":
+        return df[df["region"] == sel_region]
+    return df
+
+
+def filtrar_paises(df: pd.DataFrame, sel_paises: tuple) -> pd.DataFrame:
+    if "Todas" not in sel_paises:
+        return df[df["recipientcountry_codename"].isin(sel_paises)]
+    return df
+
+
+def filtrar_montos(df: pd.DataFrame, sel_range: tuple = None) -> pd.DataFrame:
+    if sel_range is not None and "value_usd_millions" in df.columns:
+        return df[
+            (df["value_usd_millions"] >= sel_range[0]) &
+            (df["value_usd_millions"] <= sel_range[1])
+        ]
+    return df
+
+
+def filtrar_anios(df: pd.DataFrame, sel_years: tuple = None) -> pd.DataFrame:
+    if sel_years is not None:
+        start_ts = pd.to_datetime(datetime(sel_years[0], 1, 1))
+        end_ts = pd.to_datetime(datetime(sel_years[1], 12, 31))
+        return df[
+            (df["transactiondate_isodate"] >= start_ts) &
+            (df["transactiondate_isodate"] <= end_ts)
+        ]
+    return df
+
+
+def filtrar_flujos_agregados(sel_region: str, sel_paises: tuple, sel_mod: str,
+                             sel_range: tuple = None, sel_years: tuple = None):
+    # Sin cache: son mascaras booleanas baratas sobre el frame base compartido.
+    # Se cachean solo los agregados (pequeños) que salen de aqui. Los pasos
+    # sueltos (filtrar_paises/montos/anios) permiten a la sidebar encadenarlos
+    # sobre el frame ya reducido en vez de volver a filtrar desde la base.
+    df = get_flujos_base(version_activa())
+
+    df = filtrar_region(df, sel_region)
+    if sel_mod != "Todas":
+        df = df[df["modalidad_general"] == sel_mod]
+    df = filtrar_paises(df, sel_paises)
+    df = filtrar_montos(df, sel_range)
+    return filtrar_anios(df, sel_years)
+
+
+def extremos_montos(df: pd.DataFrame):
+    # Extremos del slider de montos (None si no aplica).
+    if df.empty or "value_usd_millions" not in df.columns:
+        return None
+    return (float(df["value_usd_millions"].min()), float(df["value_usd_millions"].max()))
+
+
+def extremos_anios(df: pd.DataFrame):
+    if df.empty:
+        return None
+    fechas = df["transactiondate_isodate"].dt.year
+    return (int(fechas.min()), int(fechas.max()))
+
+
+# Cacheados: la API normaliza cada consulta con estos limites antes de
+# comparar el ETag, y no debe escanear el frame base en cada sondeo. Se
+# invalidan con el resto de cache_data al cambiar la version de datos.
+@st.cache_data(show_spinner=False, max_entries=AGREGADOS_MAX_ENTRIES, ttl=AGREGADOS_TTL_S)
+def limites_montos(sel_region: str, sel_paises: tuple, sel_mod: str):
+    # Extremos del slider de montos tras region/pais/modalidad.
+    return extremos_montos(filtrar_flujos_agregados(sel_region, sel_paises, sel_mod))
+
+
+@st.cache_data(show_spinner=False, max_entries=AGREGADOS_MAX_ENTRIES, ttl=AGREGADOS_TTL_S)
+def limites_anios(sel_region: str, sel_paises: tuple, sel_mod: str, sel_range: tuple = None):
+    # Extremos del slider de años tras el filtro de montos.
+    return extremos_anios(filtrar_flujos_agregados(sel_region, sel_paises, sel_mod, sel_range))
+
+
+def completar_filtros_flujos(sel_region: str, sel_paises: tuple, sel_mod: str,
+                             sel_range: tuple = None, sel_years: tuple = None) -> tuple:
+    # Rellena los rangos ausentes (o un extremo ausente) con los valores que
+    # los sliders muestran por defecto, para que la API y el precalentamiento
+    # usen las mismas claves de cache que el dashboard.
+    limites = limites_montos(sel_region, sel_paises, sel_mod)
+    if limites is not None:
+        sel_range = sel_range or (None, None)
+        sel_range = tuple(
+            limite if valor is None else float(valor)
+            for valor, limite in zip(sel_range, limites)
+        )
+    else:
+        sel_range = None
+
+    limites = limites_anios(sel_region, sel_paises, sel_mod, sel_range)
+    if limites is not None:
+        sel_years = sel_years or (None, None)
+        sel_years = tuple(
+            limite if valor is None else int(valor)
+            for valor, limite in zip(sel_years, limites)
+        )
+    return (sel_region, sel_paises, sel_mod, sel_range, sel_years)
+
+
+def etiquetar_periodo(fechas: pd.Series, freq_choice: str) -> pd.Series:
+    if freq_choice == "Trimestral":
+        return fechas.dt.year.astype(str) + "T" + fechas.dt.quarter.astype(str)
+    if freq_choice == "Semestral":
+        sm = (fechas.dt.month.sub(1)//6).add(1)
+        return fechas.dt.year.astype(str) + "S" + sm.astype(str)
+    return fechas.dt.year.astype(str)
+
+
+@st.cache_data(show_spinner=False, max_entries=AGREGADOS_MAX_ENTRIES, ttl=AGREGADOS_TTL_S)
+def agregar_flujos_por_fechas(filtros: tuple, freq_choice: str):
+    df = filtrar_flujos_agregados(*filtros)
+    freq_code = FRECUENCIAS[freq_choice][0]
+
+    df_agg = df.set_index("transactiondate_isodate")["value_usd"].resample(freq_code).sum().reset_index()
+    df_agg["value_usd_millions"] = df_agg["value_usd"] / 1_000_000
+    df_agg["Periodo"] = etiquetar_periodo(df_agg["transactiondate_isodate"], freq_choice)
+    return df_agg
+
+
+@st.cache_data(show_spinner=False, max_entries=AGREGADOS_MAX_ENTRIES, ttl=AGREGADOS_TTL_S)
+def agregar_flujos_por_sectores(filtros: tuple, freq_choice: str):
+    df = filtrar_flujos_agregados(*filtros)
+    # assign: sin filtros df es el frame base compartido, no se modifica.
+    df = df.assign(Periodo=etiquetar_periodo(df["transactiondate_isodate"], freq_choice))
+
+    df_agg_sec = df.groupby(["Periodo", "Sector"], as_index=False)["value_usd_millions"].sum()
+    if df_agg_sec.empty:
+        return pd.DataFrame(), pd.DataFrame(), []
+
+    top_agg = df_agg_sec.groupby("Sector", as_index=False)["value_usd_millions"].sum()
+    top_agg = top_agg.sort_values("value_usd_millions", ascending=False)
+    top_7 = top_agg["Sector"].head(7).tolist()
+
+    df_agg_sec["Sector_stack"] = df_agg_sec["Sector"].where(df_agg_sec["Sector"].isin(top_7), "OTROS")
+    df_agg_sec = df_agg_sec.groupby(["Periodo", "Sector_stack"], as_index=False)["value_usd_millions"].sum()
+
+    # Una sola pasada agrupada: columnas = sectores, filas = periodos. Las
+    # trazas salen de columnas del pivot, sin filtrar el df por sector.
+    unique_sectors = sorted(top_7) + ["OTROS"]
+    pivot_abs = df_agg_sec.pivot(index="Periodo", columns="Sector_stack", values="value_usd_millions")
+    pivot_abs = pivot_abs.reindex(columns=unique_sectors)
+    sums = pivot_abs.sum(axis=1)
+    pivot_pct = pivot_abs.fillna(0).div(sums, axis=0) * 100
+
+    return pivot_abs, pivot_pct, unique_sectors
+
+
+@st.cache_data(show_spinner=False, max_entries=AGREGADOS_MAX_ENTRIES, ttl=AGREGADOS_TTL_S)
+def calcular_yoy_flujos(sel_region: str, sel_paises: tuple, sel_years: tuple, freq_choice: str):
+    # El YoY solo depende de region, paises y años (no de modalidad ni montos).
+    freq_code, _, shift_periods = FRECUENCIAS[freq_choice]
+
+    df_global_all = filtrar_flujos_agregados("Todas", ("Todas",), "Todas", sel_years=sel_years)
+
+    if sel_region != "Todas":
+        df_region_all = filtrar_region(df_global_all, sel_region)
+    else:
+        df_region_all = pd.DataFrame()
+
+    list_countries_data_all = []
+    if sel_region != "Todas" and ("Todas" not in sel_paises):
+        for c in sel_paises:
+            temp_df = df_region_all[df_region_all["recipientcountry_codename"] == c]
+            if not temp_df.empty:
+                list_countries_data_all.append((c, temp_df))
+
+    yoy_list_all = []
+    if not df_global_all.empty:
+        yoy_g_all = compute_yoy(
+            df_global_all,
+            date_col="transactiondate_isodate",
+            value_col="value_usd",
+            freq_code=freq_code,
+            shift_periods=shift_periods
+        )
+        yoy_g_all["Categoria"] = "Global"
+        yoy_list_all.append(yoy_g_all)
+
+    if not df_region_all.empty:
+        yoy_r_all = compute_yoy(
+            df_region_all,
+            date_col="transactiondate_isodate",
+            value_col="value_usd",
+            freq_code=freq_code,
+            shift_periods=shift_periods
+        )
+        yoy_r_all["Categoria"] = f"Región: {sel_region}"
+        yoy_list_all.append(yoy_r_all)
+
+    for (country_name, df_country_all) in list_countries_data_all:
+        yoy_c_all = compute_yoy(
+            df_country_all,
+            date_col="transactiondate_isodate",
+            value_col="value_usd",
+            freq_code=freq_code,
+            shift_periods=shift_periods
+        )
+        yoy_c_all["Categoria"] = f"País: {country_name}"
+        yoy_list_all.append(yoy_c_all)
+
+    if not yoy_list_all:
+        return pd.DataFrame()
+    return pd.concat(yoy_list_all, ignore_index=True)
+
+
+# -----------------------------------------------------------------------------
+# MULTIDIMENSIONAL (DATOS)
+# -----------------------------------------------------------------------------
+@st.cache_data(show_spinner=False)
+def calcular_correlaciones(version: str):
+    df_multi = load_dataframes(version)["ACTIVITY_IADB"]
+    numeric_cols = df_multi.select_dtypes(include=[float, int]).columns
+    if len(numeric_cols) <= 1:
+        return None
+    return df_multi[numeric_cols].corr()
+
+
+# -----------------------------------------------------------------------------
+# PRECALENTAMIENTO DE CACHES (SEGUNDO PLANO)
+# -----------------------------------------------------------------------------
+# Se usa un pool de hilos (no de procesos) porque el objetivo es poblar los
+# caches de st.cache_data / st.cache_resource de este mismo proceso.
+USO_PATH = os.path.join(BASE_DIR, "uso_filtros.json")
+USO_GUARDADO_CADA_S = 30
+USO_MAX_ESTADOS = 200
+WARMUP_WORKERS = 2
+WARMUP_TOP_N = 5
+
+
+@st.cache_resource
+def get_registro_uso():
+    uso = {}
+    if os.path.exists(USO_PATH):
+        try:
+            with open(USO_PATH, encoding="utf-8") as f:
+                uso = json.load(f)
+        except (OSError, ValueError):
+            # Se aparta el archivo danado en vez de pisarlo en el proximo guardado.
+            try:
+                os.replace(USO_PATH, f"{USO_PATH}.corrupto")
+            except OSError:
+                pass
+            uso = {}
+    return {"lock": threading.Lock(), "uso": uso, "guardado": 0.0}
+
+
+def podar_conteos(conteos: dict) -> dict:
+    # Los sliders de monto generan floats casi unicos por sesion: sin tope el
+    # registro crece sin limite. Al pasar de USO_MAX_ESTADOS se conserva la
+    # mitad mas usada.
+    if len(conteos) <= USO_MAX_ESTADOS:
+        return conteos
+    ranking = sorted(conteos.items(), key=lambda kv: kv[1], reverse=True)
+    return dict(ranking[:USO_MAX_ESTADOS // 2])
+
+
+def guardar_uso(uso: dict):
+    # Escritura atomica: archivo temporal propio del proceso/hilo + os.replace,
+    # asi un corte o dos servidores escribiendo a la vez no dejan JSON a medias.
+    tmp_path = f"{USO_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(uso, f)
+        os.replace(tmp_path, USO_PATH)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def registrar_uso(pagina: str, estado):
+    registro = get_registro_uso()
+    clave = json.dumps(estado)
+    with registro["lock"]:
+        conteos = registro["uso"].setdefault(pagina, {})
+        conteos[clave] = conteos.get(clave, 0) + 1
+        registro["uso"][pagina] = podar_conteos(conteos)
+
+        ahora = time.monotonic()
+        if ahora - registro["guardado"] < USO_GUARDADO_CADA_S:
+            return
+        registro["guardado"] = ahora
+        guardar_uso(registro["uso"])
+
+
+def estados_mas_usados(pagina: str, n: int = WARMUP_TOP_N) -> list:
+    registro = get_registro_uso()
+    with registro["lock"]:
+        conteos = dict(registro["uso"].get(pagina, {}))
+    ranking = sorted(conteos.items(), key=lambda kv: kv[1], reverse=True)
+    return [json.loads(clave) for clave, _ in ranking[:n]]
+
+
+def filtros_desde_json(filtros) -> tuple:
+    # JSON convierte las tuplas en listas; las claves de cache necesitan tuplas.
+    sel_region, sel_paises, sel_mod, sel_range, sel_years = filtros
+    return (
+        sel_region,
+        tuple(sel_paises),
+        sel_mod,
+        tuple(sel_range) if sel_range is not None else None,
+        tuple(sel_years)
+    )
+
+
+def filtros_por_defecto_flujos() -> tuple:
+    # Mismos valores que producen los widgets sin tocar: "Todas" y rangos completos.
+    return completar_filtros_flujos("Todas", ("Todas",), "Todas")
+
+
+def tareas_precalentamiento(version: str) -> list:
+    tareas = [
+        (construir_facetas, ("ACTIVITY_IADB", version, "Sector_1", ("Closed", "Finalisation"))),
+        (construir_facetas, ("OUTGOING_COMMITMENT_IADB", version, "Sector")),
+        (calcular_correlaciones, (version,)),
+    ]
+
+    estados_flujos = [[filtros_por_defecto_flujos(), "Anual"]]
+    for filtros, freq_choice in estados_mas_usados("Flujos Agregados"):
+        estado = [filtros_desde_json(filtros), freq_choice]
+        if estado not in estados_flujos:
+            estados_flujos.append(estado)
+    for filtros, freq_choice in estados_flujos:
+        sel_region, sel_paises, _, _, sel_years = filtros
+        tareas.append((agregar_flujos_por_fechas, (filtros, freq_choice)))
+        tareas.append((calcular_yoy_flujos, (sel_region, sel_paises, sel_years, freq_choice)))
+        tareas.append((agregar_flujos_por_sectores, (filtros, freq_choice)))
+
+    datasets_pyg = ["ACTIVITY_IADB"]
+    for dataset_name in estados_mas_usados("Analisis Exploratorio"):
+        if dataset_name in ARCHIVOS_DATOS and dataset_name not in datasets_pyg:
+            datasets_pyg.append(dataset_name)
+    for dataset_name in datasets_pyg:
+        tareas.append((get_pyg_renderer_by_name, (dataset_name, version)))
+
+    return tareas
+
+
+def _ejecutar_tarea(funcion, args, estado: dict):
+    try:
+        funcion(*args)
+    except Exception as exc:
+        # La pagina lo recalculara bajo demanda; solo se deja constancia.
+        with estado["lock"]:
+            estado["errores"].append(f"{funcion.__name__}: {exc}")
+    finally:
+        with estado["lock"]:
+            estado["pendientes"] -= 1
+
+
+@st.cache_resource
+def iniciar_precalentamiento(version: str):
+    # Una vez por proceso y version de datos. No se espera a los futures: si
+    # una pagina llega antes que su tarea, la calcula ella misma.
+    estado = {"lock": threading.Lock(), "pendientes": 0, "errores": []}
+    try:
+        tareas = tareas_precalentamiento(version)
+    except Exception as exc:
+        estado["errores"].append(f"tareas_precalentamiento: {exc}")
+        return estado
+
+    estado["pendientes"] = len(tareas)
+    pool = ThreadPoolExecutor(max_workers=WARMUP_WORKERS, thread_name_prefix="precalentamiento")
+    for funcion, args in tareas:
+        pool.submit(_ejecutar_tarea, funcion, args, estado)
+    pool.shutdown(wait=False)
+    return estado
+
+
+# -----------------------------------------------------------------------------
+# ARRANQUE DEL PROCESO
+# -----------------------------------------------------------------------------
+def iniciar_servicios():
+    # Idempotente (todo es cache_resource): lo llama mdbs_server.py al
+    # arrancar y main() en cada rerun por si se usa "streamlit run" directo.
+    version = version_activa()
+    load_dataframes(version)
+    return iniciar_precalentamiento(version)
@@ -0,0 +1,131 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# -----------------------------------------------------------------------------
+# EXPORTACION DE DATOS FILTRADOS (SIN STREAMLIT)
+# -----------------------------------------------------------------------------
+# El Parquet se escribe en un hilo del servidor (pyarrow suelta el GIL). CSV y
+# XLSX se convierten desde ese Parquet en "python -m mdbs_exportacion ...": la
+# conversion a celdas de Python de un export grande tarda minutos y, dentro del
+# servidor, frenaria a todas las sesiones del worker.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EXPORT_DIR = os.path.join(BASE_DIR, "static", "exports")
+# Formato -> extension
+FORMATOS_EXPORTACION = {
+    "CSV": "csv",
+    "Parquet": "parquet",
+    "XLSX": "xlsx",
+}
+# Extension -> Content-Type al servir el archivo por la API
+TIPOS_MIME = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+# Nombres que genera ruta_exportacion(): sha1[:16] + extension
+PATRON_ARCHIVO = re.compile(r"^[0-9a-f]{16}\.(csv|parquet|xlsx)$")
+EXPORT_CHUNK_ROWS = 50_000
+EXCEL_MAX_ROWS = 1_048_575  # 1_048_576 menos la fila de encabezados
+CODIGO_ERROR_DATOS = 2  # salida del CLI para errores esperables (ValueError)
+
+
+def escribir_parquet(path: str, df: pd.DataFrame):
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(path, schema) as writer:
+        for inicio in range(0, max(len(df), 1), EXPORT_CHUNK_ROWS):
+            chunk = df.iloc[inicio:inicio + EXPORT_CHUNK_ROWS]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def _csv_desde_parquet(origen: str, destino: str):
+    archivo = pq.ParquetFile(origen)
+    with open(destino, "w", newline="", encoding="utf-8") as f:
+        primero = True
+        for lote in archivo.iter_batches(batch_size=EXPORT_CHUNK_ROWS):
+            lote.to_pandas().to_csv(f, index=False, header=primero)
+            primero = False
+        if primero:
+            archivo.schema_arrow.empty_table().to_pandas().to_csv(f, index=False)
+
+
+def columna_excel(serie: pd.Series) -> list:
+    # Conversion por columna (no por celda) a tipos que openpyxl acepta.
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        if serie.dt.tz is not None:
+            serie = serie.dt.tz_localize(None)
+        valores = serie.astype(object)
+    elif pd.api.types.is_bool_dtype(serie) or pd.api.types.is_numeric_dtype(serie):
+        valores = serie.astype(object)
+    else:
+        valores = serie.astype(object)
+        # Listas / structs anidados del parquet original
+        anidados = valores.notna() & ~valores.map(type).isin((str, int, float, bool, datetime, pd.Timestamp))
+        if anidados.any():
+            valores = valores.where(~anidados, valores[anidados].astype(str))
+    return valores.where(valores.notna(), None).tolist()
+
+
+def _xlsx_desde_parquet(origen: str, destino: str):
+    from openpyxl import Workbook
+
+    archivo = pq.ParquetFile(origen)
+    if archivo.metadata.num_rows > EXCEL_MAX_ROWS:
+        raise ValueError(f"{archivo.metadata.num_rows:,} filas superan el maximo de Excel; usa CSV o Parquet.")
+
+    # write_only: las filas se vuelcan a disco a medida que se agregan
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("datos")
+    ws.append([str(c) for c in archivo.schema_arrow.names])
+    for lote in archivo.iter_batches(batch_size=EXPORT_CHUNK_ROWS):
+        df = lote.to_pandas()
+        for fila in zip(*(columna_excel(df[c]) for c in df.columns)):
+            ws.append(fila)
+    wb.save(destino)
+
+
+CONVERSORES = {
+    "CSV": _csv_desde_parquet,
+    "XLSX": _xlsx_desde_parquet,
+}
+
+
+def convertir_en_subproceso(origen: str, destino: str, formato: str):
+    # Bloquea hasta que termina el hijo: se llama desde un hilo del servidor.
+    comando = [
+        sys.executable, "-m", "mdbs_exportacion",
+        "--origen", origen,
+        "--destino", destino,
+        "--formato", formato,
+    ]
+    proceso = subprocess.run(comando, cwd=BASE_DIR, capture_output=True, text=True)
+    if proceso.returncode != 0:
+        detalle = proceso.stderr.strip().splitlines()[-1:] or [f"codigo {proceso.returncode}"]
+        if proceso.returncode == CODIGO_ERROR_DATOS:
+            raise ValueError(detalle[0])
+        raise RuntimeError(detalle[0])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convierte un Parquet exportado a CSV o XLSX.")
+    parser.add_argument("--origen", required=True)
+    parser.add_argument("--destino", required=True)
+    parser.add_argument("--formato", required=True, choices=list(CONVERSORES))
+    args = parser.parse_args(argv)
+
+    try:
+        CONVERSORES[args.formato](args.origen, args.destino)
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        sys.exit(CODIGO_ERROR_DATOS)
+
+
+if __name__ == "__main__":
+    main()
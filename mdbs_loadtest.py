@@ -0,0 +1,761 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# -----------------------------------------------------------------------------
+# PRUEBA DE CARGA: SERVIDOR REAL + N SESIONES DE NAVEGADOR CONCURRENTES
+# -----------------------------------------------------------------------------
+# - Servidor: mdbs_server.py en un subproceso (streamlit real, precalentamiento
+#   y API al arrancar), envuelto por --servidor-instrumentado: cuenta hits y
+#   misses de los st.cache_* dentro del propio servidor y los expone en un
+#   puerto aparte. Su RSS se muestrea por PID.
+# - Sesiones: clientes websocket que hablan el protocolo del navegador
+#   (/_stcore/stream, BackMsg / ForwardMsg) contra ese servidor. Todas comparten
+#   sus caches y su unico precalentamiento; la latencia se mide en el cliente,
+#   desde rerun_script hasta script_finished.
+# - Consumidores de la API: HTTP contra la API del mismo servidor.
+#
+#   python mdbs_loadtest.py --sesiones 8 --iteraciones 5 --salida reporte.json
+#   python mdbs_loadtest.py --sesiones 8 --comparar reporte_anterior.json
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RUN_TIMEOUT_S = 180
+NOTA_REPORTE = (
+    "Sesiones: clientes websocket con el protocolo del navegador contra el servidor real "
+    "(mdbs_server.py); latencia medida en el cliente, de rerun_script a script_finished. "
+    "RSS y caches medidos en el proceso del servidor. No se ejecuta el JavaScript de la pagina."
+)
+# Pasos que no reproducen todo lo que haria un navegador
+NOTAS_PASOS = {
+    "mapa:sin_mapa": "ACTIVITY_IADB no trae lat/lon: la pagina muestra el placeholder, "
+                     "solo se mide su rerun (no hay mapa que mover).",
+    "mapa:paneo": "Valor nuevo del componente st_folium con centro y limites desplazados, "
+                  "como el que envia el mapa al arrastrarlo.",
+    "pygwalker:dataset": "Rerun con el explorador armado en el servidor; el iframe no se dibuja.",
+    "pygwalker:batch_get_datas_by_payload": "Consulta de kernel de un primer grafico (conteo por "
+                                            "una dimension), como al arrastrar un campo.",
+}
+RSS_MUESTREO_S = 0.5
+PATRON_FACETA = re.compile(r" \([\d,]+ \| -?[\d,]+ M USD\)$")
+WIDGETS = ("selectbox", "multiselect", "radio", "component_instance")
+
+
+# -----------------------------------------------------------------------------
+# METRICAS
+# -----------------------------------------------------------------------------
+def percentil(valores: list, p: float) -> float:
+    if not valores:
+        return float("nan")
+    ordenados = sorted(valores)
+    k = (len(ordenados) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(ordenados) - 1)
+    return ordenados[i] + (ordenados[j] - ordenados[i]) * (k - i)
+
+
+class Metricas:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencias = defaultdict(list)  # paso -> [segundos]
+        self.errores = defaultdict(list)    # paso -> [mensajes]
+        self.cache = defaultdict(lambda: {"hits": 0, "misses": 0})
+        self.api = {"200": 0, "304": 0, "error": 0}
+
+    def registrar_paso(self, paso: str, segundos: float, error: str = None):
+        with self.lock:
+            self.latencias[paso].append(segundos)
+            if error:
+                self.errores[paso].append(error)
+
+    def registrar_cache(self, nombre: str, hit: bool):
+        with self.lock:
+            self.cache[nombre]["hits" if hit else "misses"] += 1
+
+    def registrar_api(self, resultado: str):
+        with self.lock:
+            self.api[resultado] += 1
+
+    def instantanea_caches(self) -> dict:
+        with self.lock:
+            return {nombre: dict(c) for nombre, c in self.cache.items()}
+
+
+def rss_mb(pid="self"):
+    # RSS actual de un proceso (Linux); None si no se puede leer.
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            paginas = int(f.read().split()[1])
+        return paginas * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        return None
+
+
+class MuestreadorRSS(threading.Thread):
+    def __init__(self, pid: int):
+        super().__init__(name="muestreo-rss", daemon=True)
+        self.pid = pid
+        self.muestras = []  # (segundos desde inicio, MB)
+        self.detener = threading.Event()
+        self.inicio = time.monotonic()
+
+    def run(self):
+        while not self.detener.is_set():
+            mb = rss_mb(self.pid)
+            if mb is not None:
+                self.muestras.append((time.monotonic() - self.inicio, mb))
+            self.detener.wait(RSS_MUESTREO_S)
+
+
+def instrumentar_caches(metricas: Metricas) -> bool:
+    # Cuenta hits/misses envolviendo read_result de los caches de Streamlit
+    # (API interna: si cambia entre versiones, el reporte lo indica).
+    try:
+        from streamlit.runtime.caching.cache_errors import CacheKeyNotFoundError
+        from streamlit.runtime.caching.cache_data_api import DataCache
+        from streamlit.runtime.caching.cache_resource_api import ResourceCache
+    except ImportError:
+        return False
+
+    for clase in (DataCache, ResourceCache):
+        original = clase.read_result
+
+        def read_result(self, key, _original=original):
+            nombre = getattr(self, "display_name", "desconocido")
+            try:
+                valor = _original(self, key)
+            except CacheKeyNotFoundError:
+                metricas.registrar_cache(nombre, False)
+                raise
+            metricas.registrar_cache(nombre, True)
+            return valor
+
+        clase.read_result = read_result
+    return True
+
+
+# -----------------------------------------------------------------------------
+# SERVIDOR INSTRUMENTADO (CORRE DENTRO DEL SUBPROCESO)
+# -----------------------------------------------------------------------------
+class EstadisticasHandler(BaseHTTPRequestHandler):
+    metricas = None
+    instrumentados = False
+    precalentamiento = None  # estado que devuelve datos.iniciar_servicios()
+
+    def do_GET(self):
+        estado = self.precalentamiento
+        if estado is None:
+            precalentamiento = None
+        else:
+            with estado["lock"]:
+                precalentamiento = {"pendientes": estado["pendientes"], "errores": list(estado["errores"])}
+        cuerpo = json.dumps({
+            "caches": self.metricas.instantanea_caches() if self.instrumentados else None,
+            "precalentamiento": precalentamiento,
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def servidor_instrumentado(puerto_estadisticas: int, argv: list):
+    # mdbs_server.py sin cambios, con los caches instrumentados antes de que
+    # arranque el precalentamiento.
+    import mdbs_server
+
+    EstadisticasHandler.metricas = Metricas()
+    EstadisticasHandler.instrumentados = instrumentar_caches(EstadisticasHandler.metricas)
+
+    iniciar_servicios = mdbs_server.datos.iniciar_servicios
+
+    def iniciar_servicios_registrando():
+        EstadisticasHandler.precalentamiento = iniciar_servicios()
+        return EstadisticasHandler.precalentamiento
+
+    mdbs_server.datos.iniciar_servicios = iniciar_servicios_registrando
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto_estadisticas), EstadisticasHandler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="estadisticas", daemon=True).start()
+
+    sys.argv = [mdbs_server.__file__] + argv
+    mdbs_server.main()
+
+
+# -----------------------------------------------------------------------------
+# SESIONES (PROTOCOLO DEL NAVEGADOR)
+# -----------------------------------------------------------------------------
+def valor_opcion(etiqueta: str) -> str:
+    # Las opciones con facetas se muestran como "Brazil (12 | 340 M USD)".
+    return PATRON_FACETA.sub("", etiqueta)
+
+
+def opciones(w, excluir=("Todas", "Todos")) -> list:
+    return [v for v in (valor_opcion(o) for o in w.options) if v not in excluir]
+
+
+def valor_paneo(mapa, rng: random.Random) -> str:
+    # Lo que devuelve st_folium tras arrastrar el mapa: nuevos centro y limites.
+    args = json.loads(mapa.json_args)
+    lat, lng = args.get("center") or (-15.0, -60.0)
+    zoom = args.get("zoom") or 5
+    lat, lng = lat + rng.uniform(-2, 2), lng + rng.uniform(-2, 2)
+    medio = 180 / 2 ** zoom
+    return json.dumps({
+        "last_clicked": None,
+        "last_object_clicked": None,
+        "bounds": {
+            "_southWest": {"lat": lat - medio, "lng": lng - medio},
+            "_northEast": {"lat": lat + medio, "lng": lng + medio},
+        },
+        "zoom": zoom,
+        "center": {"lat": lat, "lng": lng},
+    })
+
+
+class Sesion:
+    def __init__(self, nombre: str, base_url: str, metricas: Metricas, rng: random.Random):
+        from tornado.httpclient import AsyncHTTPClient
+
+        self.nombre = nombre
+        self.base_url = base_url
+        self.metricas = metricas
+        self.rng = rng
+        self.http = AsyncHTTPClient()
+        self.ws = None
+        self.page_hash = ""
+        self.widgets = {}   # id -> (tipo, proto) del ultimo run
+        self.estados = {}   # id -> WidgetState que el navegador reenvia en cada rerun
+        self.mensajes = {}  # hash -> ForwardMsg cacheable, como el cache del navegador
+
+    async def conectar(self):
+        from tornado.websocket import websocket_connect
+
+        url = "ws" + self.base_url[len("http"):] + "/_stcore/stream"
+        self.ws = await websocket_connect(url, subprotocols=["streamlit"], max_message_size=256 * 1024 ** 2)
+
+    async def _mensaje(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        datos = await self.ws.read_message()
+        if datos is None:
+            raise ConnectionError("el servidor cerro el websocket")
+        msg = ForwardMsg()
+        msg.ParseFromString(datos)
+        if msg.WhichOneof("type") == "ref_hash":
+            # El servidor solo manda la referencia si cree que ya lo tenemos.
+            if msg.ref_hash not in self.mensajes:
+                resp = await self.http.fetch(f"{self.base_url}/_stcore/message?hash={msg.ref_hash}")
+                completo = ForwardMsg()
+                completo.ParseFromString(resp.body)
+                self.mensajes[msg.ref_hash] = completo
+            return self.mensajes[msg.ref_hash]
+        if msg.metadata.cacheable:
+            self.mensajes[msg.hash] = msg
+        return msg
+
+    async def _rerun(self) -> list:
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        back = BackMsg()
+        back.rerun_script.page_script_hash = self.page_hash
+        back.rerun_script.widget_states.widgets.extend(self.estados.values())
+        await self.ws.write_message(back.SerializeToString(), binary=True)
+
+        widgets, errores = {}, []
+        while True:
+            msg = await self._mensaje()
+            tipo = msg.WhichOneof("type")
+            if tipo == "new_session":
+                self.page_hash = msg.new_session.page_script_hash
+            elif tipo == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                elemento = msg.delta.new_element
+                clase = elemento.WhichOneof("type")
+                if clase == "exception":
+                    errores.append(elemento.exception.message)
+                elif clase in WIDGETS:
+                    proto = getattr(elemento, clase)
+                    widgets[proto.id] = (clase, proto)
+            elif tipo == "script_finished":
+                if msg.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    errores.append("error de compilacion")
+                if msg.script_finished in (ForwardMsg.FINISHED_SUCCESSFULLY,
+                                           ForwardMsg.FINISHED_WITH_COMPILE_ERROR):
+                    break
+
+        self.widgets = widgets
+        # El navegador olvida el estado de los widgets que ya no se dibujan.
+        self.estados = {i: e for i, e in self.estados.items() if i in widgets}
+        return errores
+
+    async def paso(self, nombre: str, cambios: list = ()):
+        for estado in cambios:
+            self.estados[estado.id] = estado
+        inicio = time.perf_counter()
+        try:
+            errores = await asyncio.wait_for(self._rerun(), RUN_TIMEOUT_S)
+        except Exception as exc:
+            # Sin script_finished el cliente queda desincronizado: se abandona la sesion.
+            error = f"{type(exc).__name__}: {exc}"
+            self.metricas.registrar_paso(nombre, time.perf_counter() - inicio, error)
+            raise ConnectionError(error) from exc
+        self.metricas.registrar_paso(nombre, time.perf_counter() - inicio, errores[0] if errores else None)
+
+    def widget(self, tipo: str, label: str = None, opcion: str = None):
+        for clase, w in self.widgets.values():
+            if clase != tipo:
+                continue
+            if label is not None and w.label == label:
+                return w
+            if opcion is not None and opcion in [valor_opcion(o) for o in w.options]:
+                return w
+        raise LookupError(f"No se encontró {tipo} '{label or opcion}'")
+
+    def componente(self, nombre: str):
+        for clase, w in self.widgets.values():
+            if clase == "component_instance" and nombre in w.component_name:
+                return w
+        return None
+
+    async def elegir(self, paso: str, tipo: str, valor, label: str = None, opcion: str = None):
+        # selectbox / radio mandan el indice; multiselect, la lista de indices.
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        w = self.widget(tipo, label, opcion)
+        valores = [valor_opcion(o) for o in w.options]
+        faltantes = [v for v in (valor if isinstance(valor, list) else [valor]) if v not in valores]
+        if faltantes:
+            raise LookupError(f"{faltantes} no está entre las opciones de '{w.label}'")
+        estado = WidgetState(id=w.id)
+        if isinstance(valor, list):
+            estado.int_array_value.data.extend(valores.index(v) for v in valor)
+        else:
+            estado.int_value = valores.index(valor)
+        await self.paso(paso, [estado])
+
+    async def ir_a(self, pagina: str, subpagina: str = None):
+        await self.elegir(f"navegar:{pagina}", "selectbox", pagina, label="Ir a:")
+        if subpagina:
+            await self.elegir(f"navegar:{subpagina}", "radio", subpagina, label="Elige una subpagina:")
+
+    async def escenario_regiones(self):
+        await self.ir_a("Descriptivo", "Flujos Agregados")
+        regiones = opciones(self.widget("selectbox", "Region:"), excluir=("Todas", "5-FP"))
+        for region in self.rng.sample(regiones, min(3, len(regiones))):
+            await self.elegir("flujos:region", "selectbox", region, label="Region:")
+        await self.elegir("flujos:ver_sectores", "radio", "Sectores", label="Ver por:")
+
+    async def escenario_5fp(self):
+        await self.ir_a("Descriptivo", "Ejecucion")
+        # La pagina solo ofrece 5-FP si hay datos de esa region.
+        if "5-FP" in opciones(self.widget("selectbox", "Region:")):
+            await self.elegir("ejecucion:5-FP", "selectbox", "5-FP", label="Region:")
+        await self.ir_a("Descriptivo", "Flujos Agregados")
+        await self.elegir("flujos:5-FP", "selectbox", "5-FP", label="Region:")
+
+    async def escenario_yoy_multipais(self):
+        await self.ir_a("Descriptivo", "Flujos Agregados")
+        regiones = opciones(self.widget("selectbox", "Region:"))
+        if not regiones:
+            return
+        await self.elegir("flujos:region", "selectbox", self.rng.choice(regiones), label="Region:")
+        paises = opciones(self.widget("multiselect", "Pais(es):"))
+        elegidos = self.rng.sample(paises, min(3, len(paises)))
+        if elegidos:
+            await self.elegir("flujos:paises", "multiselect", elegidos, label="Pais(es):")
+        for freq in ("Trimestral", "Semestral"):
+            await self.elegir("flujos:frecuencia", "selectbox", freq, opcion=freq)
+
+    async def escenario_mapa(self):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        await self.ir_a("Analisis Geoespacial")
+        for _ in range(3):
+            mapa = self.componente("st_folium")
+            if mapa is None:
+                await self.paso("mapa:sin_mapa")
+            else:
+                await self.paso("mapa:paneo", [WidgetState(id=mapa.id, json_value=valor_paneo(mapa, self.rng))])
+
+    async def escenario_pygwalker(self):
+        await self.ir_a("Analisis Exploratorio")
+        datasets = opciones(self.widget("selectbox", "Dataset:"))
+        await self.elegir("pygwalker:dataset", "selectbox", self.rng.choice(datasets), label="Dataset:")
+        explorador = self.componente("pygwalker")
+        if explorador is None:
+            raise LookupError("No se encontró el componente de pygwalker")
+
+        # Peticiones del explorador al abrirse (kernel_computation=True): van al
+        # endpoint que pygwalker agrega al servidor de Streamlit.
+        props = json.loads(explorador.json_args)
+        url = f"{self.base_url}/{props['communicationUrl']}/{props['id']}"
+        dimensiones = [f["fid"] for f in props["rawFields"] if f["analyticType"] == "dimension"]
+        consulta = {
+            "workflow": [{"type": "view", "query": [{
+                "op": "aggregate",
+                "groupBy": [self.rng.choice(dimensiones)],
+                "measures": [{"field": "*", "agg": "count", "asFieldKey": "count"}],
+            }]}],
+            "limit": 1000,
+        }
+        for accion, datos in (("ping", {}), ("get_latest_vis_spec", {}),
+                              ("batch_get_datas_by_payload", {"queryList": [consulta]})):
+            await self.comm_pygwalker(url, accion, datos)
+
+    async def comm_pygwalker(self, url: str, accion: str, datos: dict):
+        inicio = time.perf_counter()
+        error = None
+        try:
+            resp = await self.http.fetch(url, method="POST", body=json.dumps({"action": accion, "data": datos}),
+                                         request_timeout=RUN_TIMEOUT_S)
+            respuesta = json.loads(resp.body)
+            if respuesta.get("code", 0) != 0 or respuesta.get("success") is False:
+                error = respuesta.get("message", "error de pygwalker")
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+        self.metricas.registrar_paso(f"pygwalker:{accion}", time.perf_counter() - inicio, error)
+
+    ESCENARIOS = ("escenario_regiones", "escenario_5fp", "escenario_yoy_multipais",
+                  "escenario_mapa", "escenario_pygwalker")
+
+    async def ejecutar(self, iteraciones: int):
+        inicio = time.perf_counter()
+        try:
+            await self.conectar()
+        except Exception as exc:
+            self.metricas.registrar_paso("conectar", time.perf_counter() - inicio, f"{type(exc).__name__}: {exc}")
+            return
+        self.metricas.registrar_paso("conectar", time.perf_counter() - inicio)
+        try:
+            await self.paso("inicio")
+            for _ in range(iteraciones):
+                escenario = self.rng.choice(self.ESCENARIOS)
+                try:
+                    await getattr(self, escenario)()
+                except LookupError as exc:
+                    self.metricas.registrar_paso(escenario, 0.0, str(exc))
+        except ConnectionError:
+            pass  # ya quedo registrado en el paso que fallo
+        finally:
+            self.ws.close()
+
+
+async def ejecutar_sesiones(base_url: str, metricas: Metricas, sesiones: int, iteraciones: int, semilla: int):
+    from tornado.httpclient import AsyncHTTPClient
+
+    # Un cliente HTTP por loop: que no encole las peticiones de las sesiones.
+    AsyncHTTPClient.configure(None, max_clients=max(10, sesiones))
+    await asyncio.gather(*(
+        Sesion(f"sesion-{i}", base_url, metricas, random.Random(semilla + i)).ejecutar(iteraciones)
+        for i in range(sesiones)
+    ))
+
+
+def consumidor_api(base_url: str, metricas: Metricas, detener: threading.Event, rng: random.Random):
+    # Consumidor de alta frecuencia: reutiliza ETags como haria un cliente real.
+    consultas = [
+        "/api/aprobaciones?frecuencia=Anual",
+        "/api/aprobaciones?region=5-FP&frecuencia=Trimestral",
+        "/api/yoy?frecuencia=Anual",
+        "/api/yoy?region=5-FP&pais=Brazil&pais=Argentina&frecuencia=Semestral",
+    ]
+    etags = {}
+    while not detener.is_set():
+        consulta = rng.choice(consultas)
+        peticion = urllib.request.Request(base_url + consulta)
+        if consulta in etags:
+            peticion.add_header("If-None-Match", etags[consulta])
+        inicio = time.perf_counter()
+        try:
+            with urllib.request.urlopen(peticion, timeout=30) as resp:
+                resp.read()
+                etags[consulta] = resp.headers.get("ETag", "")
+                metricas.registrar_api("200")
+            error = None
+        except urllib.error.HTTPError as exc:
+            error = None if exc.code == 304 else f"HTTP {exc.code}"
+            metricas.registrar_api("304" if exc.code == 304 else "error")
+        except OSError as exc:
+            error = str(exc)
+            metricas.registrar_api("error")
+        metricas.registrar_paso("api:" + consulta.split("?")[0], time.perf_counter() - inicio, error)
+        detener.wait(0.05)
+
+
+# -----------------------------------------------------------------------------
+# SERVIDOR REAL (SUBPROCESO)
+# -----------------------------------------------------------------------------
+def lanzar_servidor(puerto: int, api_port: int, puerto_estadisticas: int, log) -> subprocess.Popen:
+    env = dict(os.environ, MDBS_API_PORT=str(api_port))
+    comando = [
+        sys.executable, os.path.abspath(__file__),
+        "--servidor-instrumentado", str(puerto_estadisticas),
+        "--server.headless", "true",
+        "--server.port", str(puerto),
+        "--browser.gatherUsageStats", "false",
+    ]
+    return subprocess.Popen(comando, cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def esperar_url(url: str, proceso: subprocess.Popen, timeout_s: float = RUN_TIMEOUT_S) -> bool:
+    limite = time.monotonic() + timeout_s
+    while time.monotonic() < limite and proceso.poll() is None:
+        try:
+            with urllib.request.urlopen(url, timeout=5):
+                return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+def estadisticas_servidor(url: str) -> dict:
+    with urllib.request.urlopen(url, timeout=10) as resp:
+        return json.load(resp)
+
+
+def esperar_precalentamiento(url: str, proceso: subprocess.Popen, timeout_s: float = RUN_TIMEOUT_S) -> dict:
+    limite = time.monotonic() + timeout_s
+    while True:
+        estado = estadisticas_servidor(url)
+        precalentamiento = estado["precalentamiento"]
+        if precalentamiento is None or precalentamiento["pendientes"] == 0:
+            return estado
+        if time.monotonic() >= limite or proceso.poll() is not None:
+            return estado
+        time.sleep(0.5)
+
+
+def detener_servidor(proceso: subprocess.Popen):
+    proceso.terminate()
+    try:
+        proceso.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proceso.kill()
+        proceso.wait()
+
+
+def cola_log(log, lineas: int = 20) -> str:
+    log.seek(0)
+    return "\n".join(log.read().decode("utf-8", "replace").splitlines()[-lineas:])
+
+
+# -----------------------------------------------------------------------------
+# REPORTE
+# -----------------------------------------------------------------------------
+def tasas_cache(despues: dict, antes: dict = None) -> dict:
+    # Hits / misses entre dos instantaneas del servidor (o totales si no hay "antes").
+    caches = {}
+    for nombre, c in sorted(despues.items()):
+        previo = (antes or {}).get(nombre, {"hits": 0, "misses": 0})
+        hits, misses = c["hits"] - previo["hits"], c["misses"] - previo["misses"]
+        if hits or misses:
+            caches[nombre] = {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+    return caches
+
+
+def construir_reporte(args, metricas: Metricas, muestreador: MuestreadorRSS, duracion_s: float,
+                      rss_listo: float, rss_sesiones: float, estado_inicio: dict, estado_fin: dict) -> dict:
+    pasos = {}
+    for paso, lat in sorted(metricas.latencias.items()):
+        pasos[paso] = {
+            "n": len(lat),
+            "errores": len(metricas.errores.get(paso, [])),
+            "p50_ms": percentil(lat, 50) * 1000,
+            "p90_ms": percentil(lat, 90) * 1000,
+            "p99_ms": percentil(lat, 99) * 1000,
+            "max_ms": max(lat) * 1000,
+        }
+
+    sesiones = [s for paso, lat in metricas.latencias.items() if not paso.startswith("api:") for s in lat]
+    rss = [mb for _, mb in muestreador.muestras] or [float("nan")]
+    if estado_inicio["caches"] is None:
+        caches = caches_arranque = "no disponible en esta version de streamlit"
+    else:
+        caches = tasas_cache(estado_fin["caches"], estado_inicio["caches"])
+        caches_arranque = tasas_cache(estado_inicio["caches"])
+
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "nota": NOTA_REPORTE,
+        "notas_pasos": {paso: nota for paso, nota in NOTAS_PASOS.items() if paso in pasos},
+        "parametros": {"sesiones": args.sesiones, "iteraciones": args.iteraciones,
+                       "consumidores_api": args.consumidores_api, "semilla": args.semilla,
+                       "arranque_en_frio": args.arranque_en_frio},
+        "duracion_s": duracion_s,
+        "latencia_sesiones": {
+            "n": len(sesiones),
+            "p50_ms": percentil(sesiones, 50) * 1000,
+            "p90_ms": percentil(sesiones, 90) * 1000,
+            "p99_ms": percentil(sesiones, 99) * 1000,
+        },
+        "pasos": pasos,
+        "rss_servidor_mb": {"inicio": rss[0], "al_abrir_puerto": rss_listo, "al_iniciar_sesiones": rss_sesiones,
+                            "fin": rss[-1], "pico": max(rss), "crecimiento": rss[-1] - rss_sesiones},
+        "rss_servidor_serie": muestreador.muestras,
+        "precalentamiento_al_iniciar": estado_inicio["precalentamiento"],
+        "caches": caches,
+        "caches_arranque": caches_arranque,
+        "api": metricas.api,
+        "errores": {paso: errs[:5] for paso, errs in metricas.errores.items()},
+    }
+
+
+def imprimir_reporte(reporte: dict, anterior: dict = None):
+    def delta(actual, clave_ruta):
+        if anterior is None:
+            return ""
+        previo = anterior
+        for clave in clave_ruta:
+            previo = previo.get(clave) if isinstance(previo, dict) else None
+        if not isinstance(previo, (int, float)) or not previo:
+            return ""
+        return f" ({(actual - previo) / previo * 100:+.0f}%)"
+
+    print(f"\nNota: {reporte['nota']}")
+    for paso, nota in reporte["notas_pasos"].items():
+        print(f"  {paso}: {nota}")
+    lt = reporte["latencia_sesiones"]
+    print(f"\nDuracion: {reporte['duracion_s']:.1f} s   pasos de sesion: {lt['n']}")
+    print(f"Latencia sesiones  p50 {lt['p50_ms']:.0f} ms{delta(lt['p50_ms'], ['latencia_sesiones', 'p50_ms'])}"
+          f"  p90 {lt['p90_ms']:.0f} ms{delta(lt['p90_ms'], ['latencia_sesiones', 'p90_ms'])}"
+          f"  p99 {lt['p99_ms']:.0f} ms{delta(lt['p99_ms'], ['latencia_sesiones', 'p99_ms'])}")
+
+    print(f"\n{'paso':<40}{'n':>6}{'err':>5}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    for paso, s in reporte["pasos"].items():
+        print(f"{paso:<40}{s['n']:>6}{s['errores']:>5}{s['p50_ms']:>10.0f}{s['p90_ms']:>10.0f}"
+              f"{s['p99_ms']:>10.0f}{delta(s['p90_ms'], ['pasos', paso, 'p90_ms'])}")
+
+    rss = reporte["rss_servidor_mb"]
+    print(f"\nRSS servidor: inicio {rss['inicio']:.0f} MB  al abrir puerto {rss['al_abrir_puerto']:.0f} MB"
+          f"  al iniciar sesiones {rss['al_iniciar_sesiones']:.0f} MB  fin {rss['fin']:.0f} MB"
+          f"  pico {rss['pico']:.0f} MB  crecimiento {rss['crecimiento']:+.0f} MB"
+          f"{delta(rss['crecimiento'], ['rss_servidor_mb', 'crecimiento'])}")
+    precalentamiento = reporte["precalentamiento_al_iniciar"]
+    if precalentamiento is not None:
+        print(f"Precalentamiento al iniciar sesiones: {precalentamiento['pendientes']} tareas pendientes,"
+              f" {len(precalentamiento['errores'])} errores")
+
+    if isinstance(reporte["caches"], dict):
+        print(f"\n{'cache (durante la prueba)':<44}{'hits':>8}{'misses':>8}{'hit rate':>10}")
+        for nombre, c in reporte["caches"].items():
+            print(f"{nombre[-44:]:<44}{c['hits']:>8}{c['misses']:>8}{c['hit_rate'] * 100:>9.0f}%")
+    else:
+        print(f"\nCaches: {reporte['caches']}")
+
+    api = reporte["api"]
+    print(f"\nAPI: 200={api['200']}  304={api['304']}  errores={api['error']}")
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga con sesiones concurrentes de mdbs-app.")
+    parser.add_argument("--sesiones", type=int, default=4)
+    parser.add_argument("--iteraciones", type=int, default=5, help="escenarios por sesion")
+    parser.add_argument("--consumidores-api", type=int, default=2)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--arranque-en-frio", action="store_true",
+                        help="no esperar al precalentamiento antes de abrir las sesiones")
+    parser.add_argument("--salida", default=None, help="ruta del reporte JSON")
+    parser.add_argument("--comparar", default=None, help="reporte JSON de una version anterior")
+    args = parser.parse_args()
+
+    salida = os.path.abspath(args.salida) if args.salida else None
+    comparar = os.path.abspath(args.comparar) if args.comparar else None
+
+    metricas = Metricas()
+    server_port, api_port, stats_port = puerto_libre(), puerto_libre(), puerto_libre()
+    log = tempfile.TemporaryFile()
+    servidor = lanzar_servidor(server_port, api_port, stats_port, log)
+    muestreador = MuestreadorRSS(servidor.pid)
+    muestreador.start()
+
+    detener_api = threading.Event()
+    consumidores = []
+    try:
+        if not esperar_url(f"http://127.0.0.1:{server_port}/_stcore/health", servidor):
+            raise SystemExit(f"El servidor no arranco:\n{cola_log(log)}")
+        rss_listo = rss_mb(servidor.pid)
+
+        # Con el precalentamiento terminado los numeros son comparables entre
+        # versiones; --arranque-en-frio mide sesiones que llegan durante el.
+        url_estadisticas = f"http://127.0.0.1:{stats_port}/"
+        if args.arranque_en_frio:
+            estado_inicio = estadisticas_servidor(url_estadisticas)
+        else:
+            estado_inicio = esperar_precalentamiento(url_estadisticas, servidor)
+        rss_sesiones = rss_mb(servidor.pid)
+
+        base_url = f"http://127.0.0.1:{api_port}"
+        if args.consumidores_api and esperar_url(base_url + "/api/version", servidor):
+            consumidores = [
+                threading.Thread(
+                    target=consumidor_api,
+                    args=(base_url, metricas, detener_api, random.Random(args.semilla + 1000 + i)),
+                    name=f"api-{i}", daemon=True
+                )
+                for i in range(args.consumidores_api)
+            ]
+        for c in consumidores:
+            c.start()
+
+        inicio = time.monotonic()
+        asyncio.run(ejecutar_sesiones(
+            f"http://127.0.0.1:{server_port}", metricas, args.sesiones, args.iteraciones, args.semilla
+        ))
+        duracion_s = time.monotonic() - inicio
+
+        detener_api.set()
+        for c in consumidores:
+            c.join(timeout=5)
+        estado_fin = estadisticas_servidor(url_estadisticas)
+    finally:
+        detener_api.set()
+        muestreador.detener.set()
+        muestreador.join()
+        detener_servidor(servidor)
+        log.close()
+
+    reporte = construir_reporte(args, metricas, muestreador, duracion_s, rss_listo, rss_sesiones,
+                                estado_inicio, estado_fin)
+
+    anterior = None
+    if comparar:
+        with open(comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+    imprimir_reporte(reporte, anterior)
+
+    if salida:
+        with open(salida, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, indent=2, default=str)
+        print(f"\nReporte guardado en {salida}")
+
+
+if __name__ == "__main__":
+    # El mismo archivo hace de lanzador instrumentado dentro del subproceso.
+    if sys.argv[1:2] == ["--servidor-instrumentado"]:
+        servidor_instrumentado(int(sys.argv[2]), sys.argv[3:])
+    else:
+        main()
@@ -0,0 +1,175 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.model_selection import KFold, cross_validate
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+
+# -----------------------------------------------------------------------------
+# MODELOS PREDICTIVOS (SIN STREAMLIT)
+# -----------------------------------------------------------------------------
+# Modulo aparte de mdbs-app.py y ejecutable como script: el entrenamiento
+# corre en "python -m mdbs_modelos ..." (lee su propio parquet), asi el hijo no
+# re-importa la app (page config, CSS, parquet, pygwalker) como haria un
+# ProcessPoolExecutor con spawn al cargar __main__.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARCHIVO_ACTIVIDADES = os.path.join(BASE_DIR, "activity_iadb.parquet")
+FEATURES_CATEGORICAS = ["modalidad_general", "Sector_1", "region", "recipientcountry_codename"]
+FEATURES_NUMERICAS = ["duracion_estimada", "value_usd"]
+OBJETIVOS = {
+    "completion_delay_years": "Atraso (años)",
+    "duracion_real": "Duración real (años)",
+}
+HIPERPARAMETROS_DEFECTO = {
+    "learning_rate": 0.1,
+    "max_iter": 200,
+    "max_leaf_nodes": 31,
+    "min_samples_leaf": 20,
+}
+CV_FOLDS = 5
+MODELOS_DIR = os.path.join(BASE_DIR, "modelos_entrenados")
+
+
+def features_disponibles(df: pd.DataFrame):
+    categoricas = [c for c in FEATURES_CATEGORICAS if c in df.columns]
+    numericas = [c for c in FEATURES_NUMERICAS if c in df.columns]
+    return categoricas, numericas
+
+
+def ruta_modelo(version: str, objetivo: str, hiperparametros: dict) -> str:
+    # Un archivo por version de datos + objetivo + hiperparametros: si nada de
+    # eso cambia, no se reentrena.
+    firma = hashlib.sha1(json.dumps(hiperparametros, sort_keys=True).encode()).hexdigest()[:10]
+    return os.path.join(MODELOS_DIR, version, f"{objetivo}_{firma}.joblib")
+
+
+def construir_pipeline(categoricas: list, numericas: list, hiperparametros: dict) -> Pipeline:
+    preproceso = ColumnTransformer(
+        [
+            ("cat", OneHotEncoder(handle_unknown="ignore", sparse_output=False), categoricas),
+            ("num", "passthrough", numericas),
+        ]
+    )
+    # HistGradientBoosting admite NaN en las numericas sin imputar.
+    return Pipeline(
+        [
+            ("preproceso", preproceso),
+            ("modelo", HistGradientBoostingRegressor(random_state=0, **hiperparametros)),
+        ]
+    )
+
+
+def entrenar_modelo(df: pd.DataFrame, version: str, objetivo: str, hiperparametros: dict) -> str:
+    path = ruta_modelo(version, objetivo, hiperparametros)
+    if os.path.exists(path):
+        return path
+
+    categoricas, numericas = features_disponibles(df)
+    if objetivo not in df.columns:
+        raise ValueError(f"No existe la columna objetivo '{objetivo}'.")
+    df_train = df[df[objetivo].notna()]
+    if len(df_train) < CV_FOLDS * 2:
+        raise ValueError(f"Solo hay {len(df_train)} filas con '{objetivo}' para entrenar.")
+
+    X = df_train[categoricas + numericas].copy()
+    X[categoricas] = X[categoricas].astype("object").where(X[categoricas].notna(), "N/D")
+    y = df_train[objetivo].to_numpy(dtype=float)
+
+    pipeline = construir_pipeline(categoricas, numericas, hiperparametros)
+    cv = cross_validate(
+        pipeline, X, y,
+        cv=KFold(n_splits=CV_FOLDS, shuffle=True, random_state=0),
+        scoring=("neg_mean_absolute_error", "neg_root_mean_squared_error", "r2"),
+    )
+    pipeline.fit(X, y)
+
+    resultado = {
+        "modelo": pipeline,
+        "objetivo": objetivo,
+        "version": version,
+        "hiperparametros": hiperparametros,
+        "categoricas": categoricas,
+        "numericas": numericas,
+        "n_filas": len(df_train),
+        "cv": pd.DataFrame(
+            {
+                "Fold": np.arange(1, CV_FOLDS + 1),
+                "MAE": -cv["test_neg_mean_absolute_error"],
+                "RMSE": -cv["test_neg_root_mean_squared_error"],
+                "R2": cv["test_r2"],
+            }
+        ),
+    }
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    joblib.dump(resultado, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def cargar_modelo(path: str) -> dict:
+    return joblib.load(path)
+
+
+def predecir(resultado: dict, df: pd.DataFrame) -> np.ndarray:
+    # Un solo predict sobre todo el frame (sin bucles por proyecto).
+    categoricas, numericas = resultado["categoricas"], resultado["numericas"]
+    X = df.reindex(columns=categoricas + numericas).copy()
+    X[categoricas] = X[categoricas].astype("object").where(X[categoricas].notna(), "N/D")
+    return resultado["modelo"].predict(X)
+
+
+# -----------------------------------------------------------------------------
+# ENTRENAMIENTO EN SUBPROCESO
+# -----------------------------------------------------------------------------
+def cargar_actividades(objetivo: str) -> pd.DataFrame:
+    # Solo las columnas del modelo: el hijo no carga el parquet completo.
+    disponibles = set(pq.read_schema(ARCHIVO_ACTIVIDADES).names)
+    columnas = [c for c in FEATURES_CATEGORICAS + FEATURES_NUMERICAS + [objetivo] if c in disponibles]
+    return pd.read_parquet(ARCHIVO_ACTIVIDADES, columns=columnas)
+
+
+def entrenar_en_subproceso(version: str, objetivo: str, hiperparametros: dict) -> str:
+    # Bloquea hasta que termina el hijo: se llama desde un hilo del servidor.
+    comando = [
+        sys.executable, "-m", "mdbs_modelos",
+        "--version", version,
+        "--objetivo", objetivo,
+        "--hiperparametros", json.dumps(hiperparametros, sort_keys=True),
+    ]
+    proceso = subprocess.run(comando, cwd=BASE_DIR, capture_output=True, text=True)
+    if proceso.returncode != 0:
+        detalle = proceso.stderr.strip().splitlines()[-1:] or [f"codigo {proceso.returncode}"]
+        raise RuntimeError(detalle[0])
+
+    path = ruta_modelo(version, objetivo, hiperparametros)
+    if not os.path.exists(path):
+        raise RuntimeError("El entrenamiento terminó sin generar el archivo del modelo.")
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Entrena un modelo y lo guarda en MODELOS_DIR.")
+    parser.add_argument("--version", required=True)
+    parser.add_argument("--objetivo", required=True, choices=list(OBJETIVOS))
+    parser.add_argument("--hiperparametros", default=json.dumps(HIPERPARAMETROS_DEFECTO))
+    args = parser.parse_args(argv)
+
+    hiperparametros = json.loads(args.hiperparametros)
+    df = cargar_actividades(args.objetivo)
+    print(entrenar_modelo(df, args.version, args.objetivo, hiperparametros))
+
+
+if __name__ == "__main__":
+    main()
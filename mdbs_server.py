@@ -0,0 +1,65 @@
+import os
+import sys
+
+from streamlit.web import bootstrap
+
+import mdbs_datos as datos
+from mdbs_api import iniciar_api_agregados
+
+# -----------------------------------------------------------------------------
+# LANZADOR: PRECALENTAMIENTO AL ARRANCAR EL PROCESO
+# -----------------------------------------------------------------------------
+# Sustituye a "streamlit run mdbs-app.py": carga los parquet y lanza el pool de
+# precalentamiento y la API de agregados al arrancar el proceso, de modo que
+# la primera sesion del dia ya encuentra los caches (mismo modulo mdbs_datos,
+# mismos st.cache_*) y la API responde aunque nadie haya abierto el dashboard.
+#
+#   python mdbs_server.py --server.port 8501 --server.headless true
+APP_PATH = os.path.join(datos.BASE_DIR, "mdbs-app.py")
+
+
+def _valor_flag(valor: str):
+    if valor.lower() in ("true", "false"):
+        return valor.lower() == "true"
+    try:
+        return int(valor)
+    except ValueError:
+        return valor
+
+
+def flags_desde_argv(argv: list) -> dict:
+    # "--server.port 8501" o "--server.port=8501" -> {"server_port": 8501}
+    flags = {}
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if not arg.startswith("--"):
+            raise SystemExit(f"Argumento no reconocido: {arg}")
+        if "=" in arg:
+            nombre, valor = arg[2:].split("=", 1)
+        elif i + 1 < len(argv):
+            nombre, valor = arg[2:], argv[i + 1]
+            i += 1
+        else:
+            raise SystemExit(f"Falta el valor de {arg}")
+        flags[nombre.replace(".", "_")] = _valor_flag(valor)
+        i += 1
+    return flags
+
+
+def main():
+    os.chdir(datos.BASE_DIR)
+    flag_options = flags_desde_argv(sys.argv[1:])
+    bootstrap.load_config_options(flag_options=flag_options)
+
+    # No se espera al precalentamiento: el puerto se abre en cuanto estan los
+    # parquet y el pool sigue en segundo plano. Una pagina que pide algo aun
+    # no calculado lo calcula en el momento, como sin precalentamiento.
+    datos.iniciar_servicios()
+    iniciar_api_agregados()
+
+    bootstrap.run(APP_PATH, False, [], flag_options)
+
+
+if __name__ == "__main__":
+    main()